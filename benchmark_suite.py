@@ -0,0 +1,166 @@
+"""
+    Benchmark suite: runs simulation.run and the quality measures over a grid of platform sizes and writes the
+    time of every simulation step, calculate_estimates phase and evaluate_performance phase, plus peak memory, as JSON.
+        python benchmark_suite.py --output results.json                      run the default grid
+        python benchmark_suite.py --quick --output results.json              only the small cases
+        python benchmark_suite.py --output new.json --baseline results.json  also flag regressions against a stored run
+        python benchmark_suite.py --quick --trace trace.json                 also write a Chrome trace (.jsonl: JSON lines)
+    A timing is a regression when it is more than (1 + tolerance) times its baseline and more than min_seconds slower.
+"""
+import argparse
+import json
+import platform as python_platform
+import resource
+import sys
+import time
+import tracemalloc
+import numpy as np
+import instrumentation
+import quality_measures
+import simulation
+
+DEFAULT_CASES = [
+    {"n_users": 1_000, "n_years": 1, "p_bots": 0},
+    {"n_users": 1_000, "n_years": 5, "p_bots": 0},
+    {"n_users": 10_000, "n_years": 1, "p_bots": 0},
+    {"n_users": 10_000, "n_years": 1, "p_bots": 0.2},
+    {"n_users": 100_000, "n_years": 1, "p_bots": 0},
+    {"n_users": 1_000_000, "n_years": 1, "p_bots": 0},
+]
+QUICK_CASES = [case for case in DEFAULT_CASES if case["n_users"] <= 10_000]
+
+
+def default_measures():
+    # Same measures as Tests.ipynb
+    measures = [quality_measures.SimpleMean(), quality_measures.SimpleMeanThresholdedReviewers(50),
+                quality_measures.SimpleMeanThresholdedReviewers(80), quality_measures.BayesWeightingOracle()]
+    measures.append(quality_measures.BayesWeightingMeasureEstimate(measures[2], 0.1, 0.1))
+    measures.append(quality_measures.BayesWeightingMeasureEstimate(measures[2], 0.1, 0.1, threshold_percentile=20))
+    return measures
+
+
+def _run_case(case, measures, seed, timings, tracer=None):
+    parameters = dict(simulation.SIMULATION_PARAMETERS, N_USERS_START=case["n_users"])
+    platform = simulation.run(SIMULATION_PARAMETERS=parameters, p_bots=case["p_bots"], n_years=case["n_years"],
+                              rng=np.random.default_rng(seed), timings=timings["simulation"], tracer=tracer)
+    measures_timings = timings["measures"] if tracer is None else tracer.timings("measures", timings["measures"])
+    for measure in measures:
+        measure_timings = measures_timings.setdefault(measure.name, {})
+        measure.calculate_estimates(platform, timings=measure_timings)
+        measure.evaluate_performance(platform, timings=measure_timings)
+    return platform
+
+def run_case(case, measures=None, seed=0, n_repeats=1, trace_memory=True, tracer=None):
+    """
+        case: {"n_users": N_USERS_START, "n_years": ..., "p_bots": ...}
+        The timings are the minimum over n_repeats runs. Peak memory (tracemalloc, which sees NumPy allocations)
+        is measured in a separate run, since tracing slows everything down.
+        tracer: optional instrumentation.Tracer, traces the first run
+    """
+    if measures is None: measures = default_measures()
+    result = dict(case, seed=seed)
+    best = None
+    for repeat in range(n_repeats):
+        timings = {"simulation": {}, "measures": {}}
+        start = time.perf_counter()
+        platform = _run_case(case, measures, seed, timings, tracer=tracer if repeat == 0 else None)
+        timings["total"] = time.perf_counter() - start
+        if best is None: best = timings
+        else:
+            best["total"] = min(best["total"], timings["total"])
+            best["simulation"] = {name: min(seconds, best["simulation"][name]) for name, seconds in timings["simulation"].items()}
+            best["measures"] = {measure_name: {name: min(seconds, best["measures"][measure_name][name]) for name, seconds in phases.items()}
+                                for measure_name, phases in timings["measures"].items()}
+    result["seconds"] = best
+    result["n_content"], result["n_reviews"], result["n_scores"] = len(platform.content), len(platform.reviews), len(platform.scores)
+    del platform
+
+    if trace_memory:
+        tracemalloc.start()
+        _run_case(case, measures, seed, {"simulation": {}, "measures": {}})
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+def run_suite(cases=DEFAULT_CASES, measures=None, seed=0, n_repeats=1, trace_memory=True, verbose=False, tracer=None):
+    results = {
+        "environment": {"python": sys.version, "numpy": np.__version__, "machine": python_platform.machine(),
+                        "processor": python_platform.processor(), "system": python_platform.platform()},
+        "cases": [],
+    }
+    for case in cases:
+        results["cases"].append(run_case(case, measures=measures, seed=seed, n_repeats=n_repeats, trace_memory=trace_memory, tracer=tracer))
+        if verbose: print(_case_key(case), f"{results['cases'][-1]['seconds']['total']:.2f}s", file=sys.stderr)
+    # Peak resident set size of the whole process (kilobytes on Linux)
+    results["max_rss_kilobytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return results
+
+
+def _case_key(case):
+    return f"n_users={case['n_users']} n_years={case['n_years']} p_bots={case['p_bots']}"
+
+def _flatten(case_result):
+    # {"simulation/step 1: publish content": seconds, "measures/<name>/<phase>": seconds, ...}
+    seconds = case_result["seconds"]
+    flat = {"total": seconds["total"]}
+    flat.update({f"simulation/{name}": value for name, value in seconds["simulation"].items()})
+    for measure_name, phases in seconds["measures"].items():
+        flat.update({f"measures/{measure_name}/{name}": value for name, value in phases.items()})
+    return flat
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.01, memory_tolerance=0.25):
+    """
+        Returns the regressions of results against baseline (both from run_suite), as a list of
+        (case, timing name, baseline value, new value). Cases or timings missing from either side are ignored.
+    """
+    baseline_cases = {_case_key(case): case for case in baseline["cases"]}
+    regressions = []
+    for case in results["cases"]:
+        key = _case_key(case)
+        if key not in baseline_cases: continue
+        baseline_case = baseline_cases[key]
+        baseline_seconds = _flatten(baseline_case)
+        for name, seconds in _flatten(case).items():
+            if name not in baseline_seconds: continue
+            if seconds > baseline_seconds[name] * (1 + tolerance) and seconds - baseline_seconds[name] > min_seconds:
+                regressions.append((key, name, baseline_seconds[name], seconds))
+        if "peak_memory_bytes" in case and "peak_memory_bytes" in baseline_case:
+            if case["peak_memory_bytes"] > baseline_case["peak_memory_bytes"] * (1 + memory_tolerance):
+                regressions.append((key, "peak_memory_bytes", baseline_case["peak_memory_bytes"], case["peak_memory_bytes"]))
+    return regressions
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Benchmark simulation.run and the quality measures")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--quick", action="store_true", help="only run the cases with at most 10^4 users")
+    parser.add_argument("--n-users", type=int, nargs="+", help="only run the cases with these numbers of users")
+    parser.add_argument("--repeats", type=int, default=1, help="keep the fastest of this many runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative slowdown flagged as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.01, help="ignore slowdowns smaller than this")
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slow) peak memory runs")
+    parser.add_argument("--trace", help="write a trace of the runs to this file: Chrome trace format, or JSON lines if it ends with .jsonl")
+    arguments = parser.parse_args()
+
+    cases = QUICK_CASES if arguments.quick else DEFAULT_CASES
+    if arguments.n_users: cases = [case for case in cases if case["n_users"] in arguments.n_users]
+    tracer = instrumentation.Tracer() if arguments.trace else None
+    results = run_suite(cases, seed=arguments.seed, n_repeats=arguments.repeats, trace_memory=not arguments.no_memory, verbose=True, tracer=tracer)
+    if arguments.trace:
+        if arguments.trace.endswith(".jsonl"): tracer.write_json_lines(arguments.trace)
+        else: tracer.write_chrome_trace(arguments.trace)
+    if arguments.output:
+        with open(arguments.output, "w") as f:
+            json.dump(results, f, indent=1)
+    else:
+        print(json.dumps(results, indent=1))
+
+    if arguments.baseline:
+        with open(arguments.baseline) as f:
+            regressions = compare(results, json.load(f), tolerance=arguments.tolerance, min_seconds=arguments.min_seconds)
+        for case_key, name, baseline_value, value in regressions:
+            print(f"REGRESSION {case_key} {name}: {baseline_value:.4g} -> {value:.4g}")
+        if regressions: sys.exit(1)
+        print("no regressions")
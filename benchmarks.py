@@ -0,0 +1,240 @@
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import yaml
+import quality_measures
+import random_choices
+import simulation
+import snapshot
+
+
+class _ObjectUser:
+    # Per-object layout that Platform used before the columnar store (one Python object + lists per entity)
+    def __init__(self, user_id, reviewer_quality, author_quality, expertise_topic, interest_topic, joined_year, is_bot):
+        self.id = user_id
+        self.reviewer_quality = reviewer_quality
+        self.author_quality = author_quality
+        self.expertise_topic = expertise_topic
+        self.interest_topic = interest_topic
+        self.content_ids = []
+        self.review_ids = []
+        self.joined_year = joined_year
+        self.is_bot = is_bot
+        self.active = True
+
+class _ObjectContent:
+    def __init__(self, content_id, author_id, topic, quality, published_year):
+        self.id = content_id
+        self.author_id = author_id
+        self.quality = quality
+        self.topic = topic
+        self.review_ids = []
+        self.published_year = published_year
+
+class _ObjectReview:
+    def __init__(self, review_id, author_id, content_id, evaluation, quality, published_year):
+        self.id = review_id
+        self.author_id = author_id
+        self.content_id = content_id
+        self.quality = quality
+        self.evaluation = evaluation
+        self.scores = []
+        self.published_year = published_year
+
+
+def _build_object_layout(platform):
+    joined_year = platform.year_of("users", np.arange(len(platform.users)))
+    published_year = platform.year_of("content", np.arange(len(platform.content)))
+    users = [_ObjectUser(i, float(platform.users["reviewer_quality"][i]), float(platform.users["author_quality"][i]),
+                         platform.users["expertise_topic"][i].tolist(), platform.users["interest_topic"][i].tolist(),
+                         int(joined_year[i]), bool(platform.users["is_bot"][i]))
+             for i in range(len(platform.users))]
+    content = []
+    for i in range(len(platform.content)):
+        author_id = int(platform.content["author_id"][i])
+        content.append(_ObjectContent(i, author_id, platform.content["topic"][i].tolist(), float(platform.content["quality"][i]),
+                                      int(published_year[i])))
+        users[author_id].content_ids.append(i)
+    reviews = []
+    published_year = platform.year_of("reviews", np.arange(len(platform.reviews)))
+    for i in range(len(platform.reviews)):
+        author_id, content_id = int(platform.reviews["author_id"][i]), int(platform.reviews["content_id"][i])
+        reviews.append(_ObjectReview(i, author_id, content_id, float(platform.reviews["evaluation"][i]),
+                                     float(platform.reviews["quality"][i]), int(published_year[i])))
+        users[author_id].review_ids.append(i)
+        content[content_id].review_ids.append(i)
+    for review_id, score in zip(platform.scores["review_id"].tolist(), platform.scores["score"].tolist()):
+        reviews[review_id].scores.append(score)
+    return users, content, reviews
+
+
+def _traced_size(build):
+    tracemalloc.start()
+    tracemalloc.clear_traces()
+    built = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return built, size
+
+
+def benchmark_memory_per_entity(n_users=100_000, n_years=1):
+    """
+        Bytes per entity (users + content + reviews + scores) of the columnar Platform vs the per-object layout.
+    """
+    parameters = dict(simulation.SIMULATION_PARAMETERS, N_USERS_START=n_users)
+    platform = simulation.run(SIMULATION_PARAMETERS=parameters, n_years=n_years)
+
+    def build_columnar():
+        # copy the filled part of every column (+ all CSR relation indexes) into fresh memory
+        columns = [np.array(table[name]) for table in (platform.users, platform.content, platform.reviews, platform.scores)
+                   for name in table.schema]
+        relations = [np.array(a) for relation in (platform.content_reviews(), platform.user_reviews(),
+                                                  platform.user_content(), platform.review_scores()) for a in relation]
+        return columns, relations
+    _, columnar_size = _traced_size(build_columnar)
+    _, object_size = _traced_size(lambda: _build_object_layout(platform))
+
+    n_entities = len(platform.users) + len(platform.content) + len(platform.reviews) + len(platform.scores)
+    result = {
+        "n_users": len(platform.users), "n_content": len(platform.content),
+        "n_reviews": len(platform.reviews), "n_scores": len(platform.scores),
+        "columnar_bytes_per_entity": columnar_size / n_entities,
+        "object_bytes_per_entity": object_size / n_entities,
+    }
+    result["reduction"] = result["object_bytes_per_entity"] / result["columnar_bytes_per_entity"]
+    return result
+
+
+def benchmark_simulation_year(n_users=1_000_000, n_years=1, engine="vectorized", p_bots=0):
+    """
+        Wall-clock seconds per simulated year (users joining at the start are not counted).
+    """
+    parameters = dict(simulation.SIMULATION_PARAMETERS, N_USERS_START=n_users)
+    start = time.perf_counter()
+    simulation.run(SIMULATION_PARAMETERS=parameters, p_bots=p_bots, n_years=0, engine=engine)
+    setup_time = time.perf_counter() - start
+    start = time.perf_counter()
+    platform = simulation.run(SIMULATION_PARAMETERS=parameters, p_bots=p_bots, n_years=n_years, engine=engine)
+    total_time = time.perf_counter() - start
+    return {"n_users": n_users, "engine": engine, "n_reviews": len(platform.reviews), "n_scores": len(platform.scores),
+            "seconds_per_year": (total_time - setup_time) / n_years}
+
+
+def benchmark_truncated_normal(reviewer_qualities=(1, 0.5, 0.1, 0.01, 1e-4, 1e-10), n_samples=1_000_000):
+    """
+        Seconds to draw n_samples review evaluations (content quality 0.5, SD 0.18 / reviewer quality) truncated to [0, 1],
+        together with the acceptance rate a per-sample rejection loop would have.
+    """
+    results = []
+    for reviewer_quality in reviewer_qualities:
+        means = np.full(n_samples, 0.5)
+        start = time.perf_counter()
+        samples = random_choices.truncated_normal(means, 0.18 / reviewer_quality, 0, 1)
+        seconds = time.perf_counter() - start
+        rejection_acceptance = np.mean(np.abs(np.random.randn(n_samples) * 0.18 / reviewer_quality) <= 0.5)
+        results.append({"reviewer_quality": reviewer_quality, "seconds": seconds,
+                        "sample_mean": float(samples.mean()), "sample_sd": float(samples.std()),
+                        "rejection_acceptance_rate": float(rejection_acceptance)})
+    return results
+
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(directory, name)) for directory, _, names in os.walk(path) for name in names)
+
+def benchmark_snapshot(n_users=2_000, n_years=1, include_yaml=True):
+    """
+        Write time, read time and size on disk of a platform + measures snapshot (snapshot.py),
+        against the YAML dump of the same data in the previous per-object layout.
+    """
+    parameters = dict(simulation.SIMULATION_PARAMETERS, N_USERS_START=n_users)
+    platform = simulation.run(SIMULATION_PARAMETERS=parameters, n_years=n_years)
+    measures = [quality_measures.SimpleMean(), quality_measures.SimpleMeanThresholdedReviewers(80)]
+    for measure in measures: measure.calculate_estimates(platform)
+    directory = tempfile.mkdtemp()
+    try:
+        result = {"n_users": n_users}
+        path = os.path.join(directory, "snapshot")
+        start = time.perf_counter()
+        snapshot.save_snapshot(path, platform, measures)
+        result["snapshot_write_seconds"] = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = snapshot.load_platform(path)
+        result["snapshot_open_seconds"] = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = snapshot.load_platform(path, mmap=False)
+        snapshot.load_measures(path, mmap=False)
+        result["snapshot_read_seconds"] = time.perf_counter() - start
+        result["snapshot_bytes"] = _directory_size(path)
+        if include_yaml:
+            path = os.path.join(directory, "dump.yml")
+            objects = [_build_object_layout(platform), [vars(measure) for measure in measures]]
+            start = time.perf_counter()
+            with open(path, "w") as f:
+                f.write(yaml.dump(objects))
+            result["yaml_write_seconds"] = time.perf_counter() - start
+            start = time.perf_counter()
+            with open(path) as f:
+                yaml.load(f, Loader=yaml.Loader)
+            result["yaml_read_seconds"] = time.perf_counter() - start
+            result["yaml_bytes"] = os.path.getsize(path)
+    finally:
+        shutil.rmtree(directory)
+    return result
+
+
+def benchmark_reviewer_binning(n_reviewers=(100_000, 1_000_000)):
+    """
+        Seconds spent in BayesWeightingMeasureEstimate.calculate_reviewer_weights (reviewer percentiles, bins and
+        per-bin residual statistics) for platforms with the given numbers of reviewers.
+    """
+    results = []
+    for n_users in n_reviewers:
+        platform = simulation.run(SIMULATION_PARAMETERS=dict(simulation.SIMULATION_PARAMETERS, N_USERS_START=n_users))
+        estimating_measure = quality_measures.SimpleMeanThresholdedReviewers(80)
+        estimating_measure.calculate_estimates(platform)
+        measure = quality_measures.BayesWeightingMeasureEstimate(estimating_measure, 0.1, 0.1)
+        measure.clear_scores(platform)
+        measure.calculate_reviewer_estimates(platform)
+        start = time.perf_counter()
+        measure.calculate_reviewer_weights(platform)
+        results.append({"n_reviewers": n_users, "seconds": time.perf_counter() - start})
+    return results
+
+
+def benchmark_reputation_propagation(n_reviewers=(100_000, 1_000_000), p_bots=0.2):
+    """
+        Iterations and seconds for ReputationPropagation to converge (cold, then warm-started after one more year),
+        and its performance next to BayesWeightingOracle's (reviewer estimate correlation, content estimate
+        correlation at 10% and 100% commitment).
+    """
+    results = []
+    for n_users in n_reviewers:
+        parameters = dict(simulation.SIMULATION_PARAMETERS, N_USERS_START=n_users)
+        platform = simulation.run(SIMULATION_PARAMETERS=parameters, p_bots=p_bots, rng=np.random.default_rng(0))
+        measure, oracle = quality_measures.ReputationPropagation(), quality_measures.BayesWeightingOracle()
+        result = {"n_reviewers": n_users, "p_bots": p_bots}
+        for name, evaluated in (("propagation", measure), ("oracle", oracle)):
+            evaluated.calculate_estimates(platform)
+            reviewer_correlation, _, _, content_correlations = evaluated.evaluate_performance(platform)
+            result.update({f"{name}_reviewer_correlation": reviewer_correlation,
+                           f"{name}_content_correlation_10%": content_correlations[0], f"{name}_content_correlation": content_correlations[-1]})
+        result.update({"iterations": measure.n_iterations, "converged": measure.converged, "seconds": measure.convergence_seconds})
+        simulation.run(SIMULATION_PARAMETERS=parameters, p_bots=p_bots, platform=platform)
+        measure.calculate_estimates(platform)
+        result.update({"warm_iterations": measure.n_iterations, "warm_seconds": measure.convergence_seconds})
+        results.append(result)
+    return results
+
+
+if __name__=="__main__":
+    print(benchmark_memory_per_entity())
+    print(benchmark_simulation_year(10_000, engine="loop"))
+    print(benchmark_simulation_year(1_000_000))
+    for result in benchmark_truncated_normal(): print(result)
+    print(benchmark_snapshot())
+    print(benchmark_snapshot(1_000_000, include_yaml=False))
+    for result in benchmark_reviewer_binning(): print(result)
+    for result in benchmark_reputation_propagation(): print(result)
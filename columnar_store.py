@@ -0,0 +1,275 @@
+import os
+import numpy as np
+
+
+class ColumnTable:
+    """
+        Growable struct-of-arrays table: every attribute of an entity is stored in its own contiguous NumPy column.
+        schema maps column name -> (dtype, shape of a single row's value), e.g. {"quality": (np.float64, ())}
+        Rows are only ever appended; capacity grows geometrically so appends are amortized O(1).
+    """
+    def __init__(self, schema, capacity=16):
+        self.schema = schema
+        self.n = 0
+        self._capacity = capacity
+        self._columns = {name: np.zeros((capacity,) + tuple(shape), dtype=dtype) for name, (dtype, shape) in schema.items()}
+
+    @classmethod
+    def from_columns(cls, schema, columns):
+        """
+            Table over existing arrays of equal length (e.g. np.load(..., mmap_mode="c") memory maps); they are
+            only copied into fresh memory once the table has to grow.
+        """
+        table = cls(schema, capacity=0)
+        table._columns = dict(columns)
+        table.n = table._capacity = len(next(iter(columns.values())))
+        return table
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, name):
+        # Returns a view on the filled part of the column (no copy)
+        return self._columns[name][:self.n]
+
+    def _reserve(self, n_rows):
+        if n_rows <= self._capacity: return
+        capacity = max(n_rows, 2 * self._capacity)
+        for name, column in self._columns.items():
+            grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:self.n] = column[:self.n]
+            self._columns[name] = grown
+        self._capacity = capacity
+
+    def append(self, **values):
+        """
+            Appends one row and returns its index. Columns that are not given are left zero.
+        """
+        row = self.n
+        self._reserve(row + 1)
+        for name, value in values.items():
+            self._columns[name][row] = value
+        self.n += 1
+        return row
+
+    def extend(self, n_rows, **values):
+        """
+            Appends n_rows rows at once (values are arrays of length n_rows, or scalars) and returns their indices.
+        """
+        start = self.n
+        self._reserve(start + n_rows)
+        for name, value in values.items():
+            self._columns[name][start:start + n_rows] = value
+        self.n += n_rows
+        return np.arange(start, start + n_rows)
+
+    def nbytes(self):
+        # Memory used by the filled rows (excluding the spare capacity)
+        return sum(column[:self.n].nbytes for column in self._columns.values())
+
+
+class DiskColumnTable(ColumnTable):
+    """
+        ColumnTable whose columns are memory-mapped files in directory (<column>.bin: the raw values of the rows, in
+        order), i.e. on-disk append logs for tables larger than RAM. The files grow chunk_rows rows at a time by
+        extending them and mapping them again (no copy), so appending costs no memory, and a column (table[name],
+        a memory map) only pages in the rows that are read: the OS keeps as much of the table in RAM as fits.
+        The table starts empty, unless n_rows is given: the table already in directory is then reopened with its first
+        n_rows rows (e.g. the row count a snapshot recorded), and rows after them, if any, are overwritten by the next appends.
+        Rows are never overwritten by accident: starting a new table in a directory that holds one, or reopening a table
+        with fewer rows than commit() last recorded (rows a snapshot may refer to), raises unless overwrite is set.
+    """
+    def __init__(self, schema, directory, chunk_rows=1 << 20, n_rows=None, overwrite=False):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        super().__init__(schema, capacity=0)
+        if n_rows is None:
+            os.makedirs(directory, exist_ok=True)
+            if not overwrite and (self._committed_rows() > 0 or any(os.path.exists(self._path(name)) and os.path.getsize(self._path(name)) > 0
+                                                                    for name in schema)):
+                raise FileExistsError(f"{directory} already holds a table (overwrite=True starts a new one in its place)")
+            for name in schema: open(self._path(name), "wb").close()
+            self.commit()
+            return
+        committed_rows = self._committed_rows()
+        if committed_rows > n_rows and not overwrite:
+            raise ValueError(f"{directory} holds {committed_rows} committed rows: reopening it with {n_rows} rows would overwrite "
+                             "the rows after them (overwrite=True allows it)")
+        for name in schema:
+            if os.path.getsize(self._path(name)) < n_rows * self._row_nbytes(name):
+                raise ValueError(f"{self._path(name)} holds fewer than {n_rows} rows")
+        self._reserve(n_rows)
+        self.n = n_rows
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+    def _row_nbytes(self, name):
+        dtype, shape = self.schema[name]
+        return np.dtype(dtype).itemsize * int(np.prod(tuple(shape), dtype=np.int64))
+
+    def _reserve(self, n_rows):
+        if n_rows <= self._capacity: return
+        capacity = -(-n_rows // self.chunk_rows) * self.chunk_rows
+        for name, (dtype, shape) in self.schema.items():
+            row_shape = tuple(shape)
+            with open(self._path(name), "r+b") as f:
+                f.truncate(capacity * self._row_nbytes(name))
+            # (views of the previous map stay valid: it is only unmapped once they are gone)
+            self._columns[name] = np.memmap(self._path(name), dtype=dtype, mode="r+", shape=(capacity,) + row_shape)
+        self._capacity = capacity
+
+    def flush(self):
+        # Writes the appended rows to the files (the OS otherwise does it in its own time)
+        for column in self._columns.values():
+            if isinstance(column, np.memmap): column.flush()
+
+    def commit(self):
+        # Records the current row count in directory/rows (e.g. once a snapshot refers to the rows): see __init__
+        with open(os.path.join(self.directory, "rows.saving"), "w") as f:
+            f.write(str(self.n))
+        os.replace(os.path.join(self.directory, "rows.saving"), os.path.join(self.directory, "rows"))
+    def _committed_rows(self):
+        if not os.path.exists(os.path.join(self.directory, "rows")): return 0
+        with open(os.path.join(self.directory, "rows")) as f:
+            return int(f.read())
+
+
+def lock_directory(directory):
+    """
+        Creates directory/LOCK (holding this process's id), so that no other owner takes the directory at the same
+        time, and returns the function that releases it. Raises if the lock is held (by this process or another live one);
+        the lock of a process that died without releasing it is taken over (where it can be told, i.e. on POSIX systems).
+    """
+    os.makedirs(directory, exist_ok=True)
+    lock_path = os.path.join(directory, "LOCK")
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(lock_path) as f: pid = int(f.read() or 0)
+            except FileNotFoundError:
+                continue  # (released meanwhile)
+            if pid == 0 or pid == os.getpid() or _process_alive(pid):
+                raise RuntimeError(f"{directory} is in use (by process {pid}; remove {lock_path} if it is not running)")
+            os.remove(lock_path)
+            continue
+        with os.fdopen(fd, "w") as f: f.write(str(os.getpid()))
+        break
+    def release():
+        if os.path.exists(lock_path): os.remove(lock_path)
+    return release
+
+def _process_alive(pid):
+    if os.name != "posix": return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def csr_index(keys, n_keys):
+    """
+        Groups row indices by key in CSR form: rows with key k are order[offsets[k]:offsets[k+1]],
+        in increasing row order (i.e. in the order they were appended).
+        The index is int32 whenever the table is small enough, halving its size.
+    """
+    index_dtype = np.int32 if len(keys) < 2**31 else np.int64
+    order = np.argsort(keys, kind="stable").astype(index_dtype, copy=False)
+    offsets = np.zeros(n_keys + 1, dtype=index_dtype)
+    np.cumsum(np.bincount(keys, minlength=n_keys), out=offsets[1:])
+    return offsets, order
+
+
+class IdSet:
+    """
+        Set of entity ids with O(1) add, remove and uniform sampling. The ids are packed in an array
+        (removing an id moves the last one into its place, "swap-remove") and positions[id] locates each id in it (-1 if absent).
+        Methods take arrays of ids, so a whole batch is added or removed with a few array operations.
+    """
+    def __init__(self, capacity=16):
+        self.n = 0
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._positions = np.full(capacity, -1, dtype=np.int64)
+
+    @classmethod
+    def from_ids(cls, ids):
+        # Set holding ids (distinct), packed in that order
+        id_set = cls(capacity=max(len(ids), 16))
+        id_set.add(ids)
+        return id_set
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def ids(self):
+        # View on the packed ids (in no particular order; changes as ids are added and removed)
+        return self._ids[:self.n]
+
+    def __contains__(self, entity_id):
+        return entity_id < len(self._positions) and self._positions[entity_id] >= 0
+
+    def _contains(self, ids):
+        present = np.zeros(len(ids), dtype=bool)
+        in_range = ids < len(self._positions)
+        present[in_range] = self._positions[ids[in_range]] >= 0
+        return present
+
+    def _distinct(self, ids):
+        # ids without repeats, in O(len(ids)) and in their order: every occurrence writes its index into the positions
+        # array, one write per id survives, and that occurrence is kept (positions are restored afterwards).
+        occurrences = np.arange(len(ids))
+        saved = self._positions[ids]
+        self._positions[ids] = occurrences
+        distinct = ids[self._positions[ids] == occurrences]
+        self._positions[ids] = saved
+        return distinct
+
+    def add(self, ids):
+        """
+            Adds the ids that are not in the set yet (packed in the order given).
+        """
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        if len(ids) == 0: return
+        if ids.max() >= len(self._positions):
+            positions = np.full(max(ids.max() + 1, 2 * len(self._positions)), -1, dtype=np.int64)
+            positions[:len(self._positions)] = self._positions
+            self._positions = positions
+        ids = self._distinct(ids[self._positions[ids] < 0])
+        if self.n + len(ids) > len(self._ids):
+            grown = np.zeros(max(self.n + len(ids), 2 * len(self._ids)), dtype=np.int64)
+            grown[:self.n] = self._ids[:self.n]
+            self._ids = grown
+        self._ids[self.n:self.n + len(ids)] = ids
+        self._positions[ids] = np.arange(self.n, self.n + len(ids))
+        self.n += len(ids)
+
+    def remove(self, ids):
+        """
+            Removes the ids that are in the set. The holes they leave in the packed array are filled with the
+            ids from its end that are not removed, so the cost is O(len(ids)).
+        """
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        ids = self._distinct(ids[self._contains(ids)])
+        if len(ids) == 0: return
+        positions = self._positions[ids]
+        n = self.n - len(ids)
+        holes = positions[positions < n]
+        kept_at_end = np.ones(len(ids), dtype=bool)
+        kept_at_end[positions[positions >= n] - n] = False
+        movers = self._ids[n:self.n][kept_at_end]
+        self._ids[holes] = movers
+        self._positions[movers] = holes
+        self._positions[ids] = -1
+        self.n = n
+
+    def sample(self, rng, size=None, replace=True):
+        """
+            Uniformly chosen ids (one id if size is None); O(1) per id with replacement.
+        """
+        if replace: return self._ids[rng.integers(self.n, size=size)]
+        return self._ids[rng.choice(self.n, size, replace=False)]
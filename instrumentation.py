@@ -0,0 +1,151 @@
+"""
+    Timings and traces of runs.
+    timed(timings, name) adds the seconds of a block to a timings dict (simulation steps, calculate_estimates phases...).
+    A Tracer additionally records a structured trace:
+        - a span for every timed block (start, duration, thread, simulated year)
+        - per-year counters (entities created, user exits, noisy samples drawn, ...) and histograms, fed by the
+          platform hooks (Platform.tracer) and flushed at the end of every simulated year
+    written as JSON lines (one event per line) or in Chrome trace event format (chrome://tracing, Perfetto).
+    Disabled instrumentation is None everywhere (timings=None, Platform.tracer=None): a hook then costs one `is None` test.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+
+@contextmanager
+def timed(timings, name):
+    """
+        Adds the seconds spent in the with-block to timings[name]; does nothing if timings is None.
+        With TracedTimings (Tracer.timings), the block is also recorded as a span of the tracer.
+    """
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stop = time.perf_counter()
+        timings[name] = timings.get(name, 0) + stop - start
+        if isinstance(timings, TracedTimings): timings.tracer.add_span(name, timings.category, start, stop)
+
+
+class TracedTimings:
+    """
+        Timings dict (name -> total seconds, kept in self.timings) whose timed blocks are also spans of tracer.
+        Nested timings (setdefault, e.g. one dict per measure) trace into the same tracer, under category/name.
+    """
+    def __init__(self, tracer, category, timings=None):
+        self.tracer, self.category = tracer, category
+        self.timings = {} if timings is None else timings
+
+    def get(self, name, default=None):
+        return self.timings.get(name, default)
+    def __getitem__(self, name):
+        return self.timings[name]
+    def __setitem__(self, name, seconds):
+        self.timings[name] = seconds
+    def setdefault(self, name, default=None):
+        nested = self.timings.setdefault(name, {} if default is None else default)
+        if isinstance(nested, TracedTimings): return nested
+        return TracedTimings(self.tracer, f"{self.category}/{name}", nested)
+
+
+class Tracer:
+    """
+        Collects the events of a run in self.events (dicts, in order):
+            {"type": "span", "name", "category", "year", "start", "seconds", "thread"}     a timed block
+            {"type": "counters", "year", "time", "values": {name: value}}                 counters of a year
+            {"type": "histogram", "name", "year", "time", "edges", "counts"}              histogram of a year
+        Times are seconds since the tracer was created. Counters also hold the seconds spent in every span of the
+        year ("<category>/<name> seconds"). Thread-safe (measures may run in threads, see measure_engine).
+    """
+    def __init__(self):
+        self.events = []
+        self.year = None  # year the counters and histograms go to (None: outside the simulated years)
+        self._counters = {}
+        self._histograms = {}
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def timings(self, category, timings=None):
+        # Timings to pass wherever timings are accepted; the totals also go to timings if given
+        if isinstance(timings, TracedTimings): return timings
+        return TracedTimings(self, category, timings)
+
+    def add_span(self, name, category, start, stop):
+        with self._lock:
+            self.events.append({"type": "span", "name": name, "category": category, "year": self.year,
+                                "start": start - self._origin, "seconds": stop - start, "thread": threading.get_ident()})
+            key = f"{category}/{name} seconds"
+            self._counters[key] = self._counters.get(key, 0) + stop - start
+    @contextmanager
+    def span(self, name, category):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, category, start, time.perf_counter())
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+    def histogram(self, name, values, edges):
+        # Adds values to this year's histogram name (whose bins are always edges)
+        counts = np.histogram(values, edges)[0]
+        with self._lock:
+            if name in self._histograms: self._histograms[name][1] += counts
+            else: self._histograms[name] = [np.asarray(edges, dtype=float), counts]
+
+    def begin_year(self, year):
+        self.end_year()
+        self.year = year
+    def end_year(self):
+        # Flushes the counters and histograms of the current year (if any) into events; what follows belongs to no year
+        # (e.g. the measures evaluated after simulation.run) until the next begin_year
+        with self._lock:
+            now = time.perf_counter() - self._origin
+            if self._counters:
+                self.events.append({"type": "counters", "year": self.year, "time": now, "values": self._counters})
+            for name, (edges, counts) in self._histograms.items():
+                self.events.append({"type": "histogram", "name": name, "year": self.year, "time": now,
+                                    "edges": edges.tolist(), "counts": counts.tolist()})
+            self._counters, self._histograms = {}, {}
+            self.year = None
+
+    def write_json_lines(self, path):
+        self.end_year()
+        with open(path, "w") as f:
+            for event in self.events:
+                f.write(json.dumps(event, default=_json_number) + "\n")
+
+    def chrome_trace(self):
+        # The events in Chrome trace event format: spans are complete events ("X"), counters counter events ("C")
+        # and histograms instant events ("i") holding the bins in their args. Timestamps are in microseconds.
+        self.end_year()
+        trace_events = []
+        for event in self.events:
+            year_args = {"year": event["year"]}
+            if event["type"] == "span":
+                trace_events.append({"name": event["name"], "cat": event["category"], "ph": "X", "pid": 0, "tid": event["thread"],
+                                     "ts": event["start"] * 1e6, "dur": event["seconds"] * 1e6, "args": year_args})
+            elif event["type"] == "counters":
+                for name, value in event["values"].items():
+                    trace_events.append({"name": name, "ph": "C", "pid": 0, "ts": event["time"] * 1e6, "args": {"value": value}})
+            else:
+                trace_events.append({"name": event["name"], "cat": "histogram", "ph": "i", "s": "g", "pid": 0, "ts": event["time"] * 1e6,
+                                     "args": dict(year_args, edges=event["edges"], counts=event["counts"])})
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+    def write_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f, default=_json_number)
+
+
+def _json_number(value):
+    # NumPy scalars (e.g. counters summed from arrays) as JSON numbers
+    if isinstance(value, np.integer): return int(value)
+    if isinstance(value, np.floating): return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
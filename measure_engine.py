@@ -0,0 +1,90 @@
+"""
+    Evaluates several quality measures on the same platform, sharing the work they have in common:
+        - the measures are ordered by their dependencies (QualityMeasure.dependencies, e.g. the estimating_measure
+          of BayesWeightingMeasureEstimate); dependencies missing from the list are calculated too
+        - they all use one SharedIntermediates per platform, so reviewer reputations, content x reviewer matrices and
+          percentile thresholds are computed once
+        - measures that do not depend on each other run in parallel threads (NumPy and SciPy release the GIL in
+          their heavy loops)
+"""
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+import quality_measures
+
+
+def dependency_order(measures):
+    """
+        measures and (recursively) their dependencies, each once, every measure after the measures it depends on.
+    """
+    ordered, state = [], {}
+    def visit(measure):
+        if state.get(id(measure)) == "done": return
+        if state.get(id(measure)) == "visiting": raise ValueError(f"circular dependency through measure '{measure.name}'")
+        state[id(measure)] = "visiting"
+        for dependency in measure.dependencies(): visit(dependency)
+        state[id(measure)] = "done"
+        ordered.append(measure)
+    for measure in measures: visit(measure)
+    return ordered
+
+
+class MeasureEngine:
+    def __init__(self, measures, n_workers=None):
+        """
+            n_workers: number of threads (default: one per measure, up to the number of CPUs); 1 runs the measures in order
+        """
+        self.measures = list(measures)
+        self.ordered_measures = dependency_order(self.measures)
+        if n_workers is None: n_workers = min(len(self.ordered_measures), os.cpu_count() or 1)
+        self.n_workers = max(n_workers, 1)
+        self._shared = weakref.WeakKeyDictionary()
+
+    def shared(self, platform):
+        # SharedIntermediates of the platform (kept between calls; they are recomputed when the platform changes)
+        if platform not in self._shared: self._shared[platform] = quality_measures.SharedIntermediates(platform)
+        return self._shared[platform]
+
+    def _run(self, task):
+        # Calls task(measure) for every measure, each once all its dependencies' tasks are done
+        if self.n_workers == 1:
+            return {id(measure): task(measure) for measure in self.ordered_measures}
+        futures = {}
+        def run_after_dependencies(measure):
+            # Dependencies were submitted earlier and the pool starts tasks in submission order,
+            # so they are already running or done: waiting for them cannot deadlock.
+            for dependency in measure.dependencies(): futures[id(dependency)].result()
+            return task(measure)
+        with ThreadPoolExecutor(max_workers=self.n_workers) as pool:
+            for measure in self.ordered_measures:
+                futures[id(measure)] = pool.submit(run_after_dependencies, measure)
+            return {measure_id: future.result() for measure_id, future in futures.items()}
+
+    def calculate_estimates(self, platform, timings=None):
+        """
+            Calculates the estimates of every measure (and of their dependencies).
+            timings: optional dict, receives {measure name: {phase: seconds}}
+        """
+        shared = self.shared(platform)
+        measure_timings = {id(measure): None if timings is None else timings.setdefault(measure.name, {}) for measure in self.ordered_measures}
+        self._run(lambda measure: measure.calculate_estimates(platform, timings=measure_timings[id(measure)], shared=shared))
+
+    def update_estimates(self, platform, since_year=None, timings=None):
+        """
+            Updates the estimates of every measure (and of their dependencies) with QualityMeasure.update_estimates.
+        """
+        shared = self.shared(platform)
+        measure_timings = {id(measure): None if timings is None else timings.setdefault(measure.name, {}) for measure in self.ordered_measures}
+        self._run(lambda measure: measure.update_estimates(platform, since_year, timings=measure_timings[id(measure)], shared=shared))
+
+    def evaluate(self, platform, commitment_resolution=0.1, timings=None):
+        """
+            Calculates the estimates of every measure and returns [measure.evaluate_performance(...) for measure in measures]
+        """
+        measure_timings = {id(measure): None if timings is None else timings.setdefault(measure.name, {}) for measure in self.ordered_measures}
+        shared = self.shared(platform)
+        def calculate_and_evaluate(measure):
+            measure.calculate_estimates(platform, timings=measure_timings[id(measure)], shared=shared)
+            return measure.evaluate_performance(platform, commitment_resolution=commitment_resolution, timings=measure_timings[id(measure)])
+        performances = self._run(calculate_and_evaluate)
+        return [performances[id(measure)] for measure in self.measures]
@@ -1,8 +1,16 @@
+import os
+import weakref
 import numpy as np
+import scipy.sparse
 import random_choices
+import topic_index
+from columnar_store import ColumnTable, DiskColumnTable, IdSet, csr_index, lock_directory
 
 PLATFORM_PARAMETERS = {
     "TOPIC_DIMENSIONALITY": 1,  # dimensionality of the "topic" vector, describing users' interests/expertise
+    "TOPIC_DISTRIBUTION": "one-hot",  # "one-hot": every topic is (1, 0, ..., 0); "sphere": uniformly distributed on the unit sphere
+    "TOPIC_INDEX_N_CELLS": None,  # cells of Platform.content_topic_index (None: square root of the number of content)
+    "TOPIC_INDEX_RETRAIN_GROWTH": 4,  # retrain Platform.content_topic_index once the content grew this many times over (None: never)
 
     "CONSTRAIN_SCORES_TO_01": True,
 
@@ -13,90 +21,404 @@ PLATFORM_PARAMETERS = {
     "BOT_TRUE_AUTHOR_QUALITY": 1e-10,
 }
 
+# Bins of the histograms traced by the platform (see Platform.tracer)
+QUALITY_HISTOGRAM_EDGES = np.linspace(0, 1, 11)
+ATTEMPTS_HISTOGRAM_EDGES = 2.0 ** np.arange(21)  # (the last bin also counts everything above)
+
+YEAR_TABLES = ("users", "content", "reviews", "scores")  # tables whose rows are dated by Platform.year_starts
+
 class Platform():
-    def __init__(self, PARAMETERS=PLATFORM_PARAMETERS):
-        self.CONTENT = []
-        self.REVIEWS = []
-        self.USERS = []
+    """
+        All entities are stored column-wise (see columnar_store.py): one NumPy array per attribute in
+        self.users, self.content, self.reviews and self.scores. Relations (content -> reviews, user -> reviews,
+        user -> content, review -> scores) are CSR indexes built from the foreign-key columns on demand.
+        self.USERS, self.CONTENT and self.REVIEWS give the object-style view (User, Content, Review) on top of the columns.
+        Sampling indexes, kept up to date as users join/leave and content gets reviewed, make random picks O(1):
+        self.active_users (IdSet of the users with users["active"] set; change it through set_users_active)
+        and self.reviewed_content (IdSet of the content with at least one review).
+        Out of core (storage_path given), reviews and scores, the tables that grow with every event, are on-disk
+        append logs (columnar_store.DiskColumnTable) in storage_path/reviews and storage_path/scores, and the quality
+        measures read them chunk by chunk (see quality_measures.SharedIntermediates). Users and content, and the
+        content -> reviews index of the simulation, stay in memory. The platform holds storage_path's lock while it
+        exists, so no other platform appends to the same logs; logs already in storage_path are only overwritten
+        with overwrite_storage=True.
+    """
+    def __init__(self, PARAMETERS=PLATFORM_PARAMETERS, rng=None, storage_path=None, overwrite_storage=False):
+        # PARAMETERS may lack the keys added since it was written: they keep their PLATFORM_PARAMETERS value
+        PARAMETERS = dict(PLATFORM_PARAMETERS, **PARAMETERS)
+        D = PARAMETERS["TOPIC_DIMENSIONALITY"]
+        self.users = ColumnTable({
+            "reviewer_quality": (np.float64, ()),
+            "author_quality": (np.float64, ()),
+            "expertise_topic": (np.float32, (D,)),
+            "interest_topic": (np.float32, (D,)),
+            "is_bot": (np.bool_, ()),
+            "active": (np.bool_, ()),
+        })
+        self.content = ColumnTable({
+            "author_id": (np.int32, ()),
+            "quality": (np.float64, ()),
+            "topic": (np.float32, (D,)),
+        })
+        self.reviews = ColumnTable({
+            "author_id": (np.int32, ()),
+            "content_id": (np.int32, ()),
+            "evaluation": (np.float64, ()),
+            "quality": (np.float64, ()),
+        })
+        self.scores = ColumnTable({
+            "review_id": (np.int32, ()),
+            "scorer_id": (np.int32, ()),
+            "score": (np.float64, ()),
+        })
+        self.storage_path = None
+        if storage_path is not None: self._open_storage(storage_path, overwrite=overwrite_storage)
+        self._relations = {}
+        self.active_users = IdSet()
+        self.reviewed_content = IdSet()
+        self._content_topic_index = None
+        self.listeners = []  # e.g. quality_measures.IncrementalQualityMeasure, notified of every batch of new content, reviews and scores
+        self.tracer = None  # instrumentation.Tracer counting the events (set by simulation.run(tracer=...)); None: disabled
+        self.CONTENT = EntityList(self, self.content, Content)
+        self.REVIEWS = EntityList(self, self.reviews, Review)
+        self.USERS = EntityList(self, self.users, User)
+        self.year_starts = {table_name: [] for table_name in YEAR_TABLES}
         self.CURRENT_YEAR = 0
+        self.SIMULATED_YEARS = 0  # number of years simulation.run has simulated on this platform (the next year to simulate)
         self.PARAMETERS = PARAMETERS
+        # All randomness of the platform (and of simulation.run) comes from this np.random.Generator.
+        # By default it is seeded from the global np.random state, so np.random.seed() still makes runs reproducible.
+        self.rng = rng if rng is not None else np.random.default_rng(np.random.randint(2**63))
+
+    @property
+    def CURRENT_YEAR(self):
+        return self._current_year
+    @CURRENT_YEAR.setter
+    def CURRENT_YEAR(self, year):
+        # Entering a new year records where its rows start in every table (years without rows start where the next one does)
+        for table_name, starts in self.year_starts.items():
+            starts.extend([len(getattr(self, table_name))] * (year + 1 - len(starts)))
+        self._current_year = year
+
+    def _open_storage(self, storage_path, event_rows=None, overwrite=False):
+        # Replaces the (empty) reviews and scores tables by logs in storage_path, under its lock until the platform is
+        # garbage collected: new logs, or with event_rows ({table name: row count}, e.g. a snapshot's) the logs there reopened
+        release = lock_directory(storage_path)
+        try:
+            for table_name in ("reviews", "scores"):
+                setattr(self, table_name, DiskColumnTable(getattr(self, table_name).schema, os.path.join(storage_path, table_name),
+                                                          n_rows=None if event_rows is None else event_rows[table_name], overwrite=overwrite))
+        except BaseException:
+            release()
+            raise
+        weakref.finalize(self, release)
+        self.storage_path = storage_path
+
+    def _relation(self, name, table, key_column, n_keys):
+        # CSR index of table rows grouped by key_column; tables are append-only, so the cached index is valid
+        # as long as neither the table nor the key space has grown.
+        cached = self._relations.get(name)
+        if cached is None or cached[0] != len(table) or cached[1] != n_keys:
+            offsets, order = csr_index(table[key_column], n_keys)
+            cached = (len(table), n_keys, offsets, order)
+            self._relations[name] = cached
+        return cached[2], cached[3]
+    def first_id_since(self, table_name, year):
+        # The rows of table_name from year on are the ids from the returned one on: the watermark of incremental updates
+        starts = self.year_starts[table_name]
+        return starts[max(year, 0)] if year < len(starts) else len(getattr(self, table_name))
+    def year_of(self, table_name, ids):
+        # Year each row of table_name was added in (users: joined_year; content, reviews and scores: published_year)
+        return np.searchsorted(self.year_starts[table_name], ids, side="right") - 1
+    def content_reviews(self):
+        return self._relation("content_reviews", self.reviews, "content_id", len(self.content))
+    def user_reviews(self):
+        return self._relation("user_reviews", self.reviews, "author_id", len(self.users))
+    def user_content(self):
+        return self._relation("user_content", self.content, "author_id", len(self.users))
+    def review_scores(self):
+        return self._relation("review_scores", self.scores, "review_id", len(self.reviews))
+
+    def set_users_active(self, user_ids, active):
+        # Sets users["active"] and keeps the active_users index in sync
+        self.users["active"][user_ids] = active
+        if self.tracer is not None: self.tracer.count("users returning" if active else "user exits", np.size(user_ids))
+        if active: self.active_users.add(user_ids)
+        else: self.active_users.remove(user_ids)
 
+    def content_topic_index(self):
+        """
+            Approximate nearest-neighbour index (topic_index.IVFIndex) over content["topic"]: trained on the content
+            published when it is first needed, then brought up to date with the content published since at every call.
+            Once the content has grown TOPIC_INDEX_RETRAIN_GROWTH times over since the training, the index is trained
+            again on all of it, so that the cells (square root of the number of content by default) keep up with
+            the content instead of filling up.
+        """
+        index, growth = self._content_topic_index, self.PARAMETERS["TOPIC_INDEX_RETRAIN_GROWTH"]
+        if index is None or (growth is not None and len(self.content) >= growth * index.n_trained_on):
+            n_cells = self.PARAMETERS["TOPIC_INDEX_N_CELLS"] or int(np.sqrt(len(self.content)))
+            index = self._content_topic_index = topic_index.IVFIndex.train(self.content["topic"], n_cells, self.rng)
+        if len(index) < len(self.content): index.add(self.content["topic"][len(index):])
+        return index
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+    def _notify(self, event, ids):
+        # Listeners get the ids of a batch of new entities as one array (of a single id for the single-event methods)
+        ids = np.atleast_1d(ids)
+        for listener in self.listeners: getattr(listener, event)(self, ids)
+
+    def _pair_pattern(self, name, row_keys, col_keys, shape):
+        # Sparsity pattern (CSR indptr/indices) of the matrix with an entry for every distinct (row_key, col_key) pair,
+        # plus the position of each event's pair in it, cached like the relations above.
+        cached = self._relations.get(name)
+        if cached is None or cached[0] != len(row_keys) or cached[1] != shape:
+            pairs, pair_index = np.unique(row_keys.astype(np.int64) * shape[1] + col_keys, return_inverse=True)
+            indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+            np.cumsum(np.bincount(pairs // shape[1], minlength=shape[0]), out=indptr[1:])
+            cached = (len(row_keys), shape, indptr, pairs % shape[1], pair_index)
+            self._relations[name] = cached
+        return cached[2], cached[3], cached[4]
+    def _pair_matrix(self, pattern, values):
+        indptr, indices, pair_index = pattern
+        data = np.bincount(pair_index, weights=values, minlength=len(indices))
+        return scipy.sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(self.users)))
+    def content_reviewer_matrix(self, review_values=None):
+        """
+            content x reviewer sparse matrix whose entry (c, u) is the sum of review_values (one value per review)
+            over u's reviews of content c; with review_values=None it counts the reviews.
+        """
+        pattern = self._pair_pattern("content_reviewer", self.reviews["content_id"], self.reviews["author_id"],
+                                     (len(self.content), len(self.users)))
+        return self._pair_matrix(pattern, review_values)
+    def reviewer_scorer_matrix(self, score_values=None):
+        """
+            reviewer x score-giver sparse matrix whose entry (u, s) is the sum of score_values (one value per score)
+            over the scores s gave to u's reviews; with score_values=None it counts the scores.
+        """
+        pattern = self._pair_pattern("reviewer_scorer", self.reviews["author_id"][self.scores["review_id"]], self.scores["scorer_id"],
+                                     (len(self.users), len(self.users)))
+        return self._pair_matrix(pattern, score_values)
+
+    def _choose_expertise_topics(self, n_users):
+        # (n_users, TOPIC_DIMENSIONALITY) float32 matrix
+        if self.PARAMETERS["TOPIC_DISTRIBUTION"] == "sphere":
+            return topic_index.unit_sphere(self.rng, n_users, self.PARAMETERS["TOPIC_DIMENSIONALITY"])  # RANDOMCHOICE
+        topics = np.zeros((n_users, self.PARAMETERS["TOPIC_DIMENSIONALITY"]), dtype=np.float32)
+        topics[:, 0] = 1
+        return topics
     def _choose_expertise_topic(self):
-        topic = np.zeros(self.PARAMETERS["TOPIC_DIMENSIONALITY"])
-        topic[0] = 1
-        return topic.tolist()
+        return self._choose_expertise_topics(1)[0]
     def _choose_interest_topic(self, expertise_topic):
         return expertise_topic
 
+    def _noisy_score(self, means, sds, kind="evaluation", traced=True):
+        # Normally distributed around means; truncated (not clipped) to [0, 1] if CONSTRAIN_SCORES_TO_01
+        # (kind, "evaluation" or "score", only tells the tracer what is drawn; traced, a mask broadcast with means,
+        # the draws it counts: those that are kept)
+        if self.PARAMETERS["CONSTRAIN_SCORES_TO_01"]:
+            if self.tracer is not None: self._trace_truncated_normal(means, sds, kind, traced)
+            return random_choices.truncated_normal(means, sds, 0, 1, rng=self.rng)
+        return means + self.rng.standard_normal(np.shape(means)) * sds
+
+    def _trace_truncated_normal(self, means, sds, kind, traced=True):
+        # Samples are exact (inverse CDF). The former code drew evaluations with a rejection loop and clipped scores:
+        # trace the attempts that loop would have needed, and the expected number of scores clipping would have put on 0 or 1
+        means, sds = np.broadcast_arrays(means, sds)
+        traced = np.broadcast_to(traced, means.shape)
+        acceptance = random_choices.truncated_normal_acceptance(means[traced], sds[traced], 0, 1)
+        self.tracer.count(f"truncated normal {kind}s", np.size(acceptance))
+        if kind == "score":
+            self.tracer.count("score clippings avoided", float(np.sum(1 - acceptance)))
+            return
+        with np.errstate(divide="ignore"):
+            attempts = 1 / acceptance
+        self.tracer.count("rejection attempts avoided", float(np.sum(attempts[np.isfinite(attempts)])))
+        self.tracer.histogram("rejection attempts per evaluation", np.minimum(attempts, ATTEMPTS_HISTOGRAM_EDGES[-1]), ATTEMPTS_HISTOGRAM_EDGES)
+
     def add_genuine_user(self):
-        user_id = len(self.USERS)
-        reviewer_quality = np.random.rand()  # RANDOMCHOICE
-        author_quality = np.random.rand()  # RANDOMCHOICE
+        reviewer_quality = self.rng.random()  # RANDOMCHOICE
+        author_quality = self.rng.random()  # RANDOMCHOICE
         expertise_topic = self._choose_expertise_topic()
         interest_topic = self._choose_interest_topic(expertise_topic)
-        self.USERS.append(User(user_id, reviewer_quality, author_quality, expertise_topic, interest_topic, self.CURRENT_YEAR))
+        user_id = self.users.append(reviewer_quality=reviewer_quality, author_quality=author_quality,
+                                    expertise_topic=expertise_topic, interest_topic=interest_topic,
+                                    is_bot=False, active=True)
+        self.active_users.add(user_id)
+        if self.tracer is not None: self.tracer.count("users joined")
     def add_bot_user(self):
-        user_id = len(self.USERS)
-        self.USERS.append(Bot(user_idc, self.CURRENT_YEAR))
+        topic = self._choose_expertise_topic()
+        user_id = self.users.append(reviewer_quality=self.PARAMETERS["BOT_TRUE_REVIEWER_QUALITY"],
+                                    author_quality=self.PARAMETERS["BOT_TRUE_AUTHOR_QUALITY"],
+                                    expertise_topic=topic, interest_topic=topic,
+                                    is_bot=True, active=True)
+        self.active_users.add(user_id)
+        if self.tracer is not None: self.tracer.count("bots joined")
+
+    def add_genuine_users(self, n_users):
+        reviewer_quality = self.rng.random(n_users)  # RANDOMCHOICE
+        author_quality = self.rng.random(n_users)  # RANDOMCHOICE
+        expertise_topic = self._choose_expertise_topics(n_users)
+        interest_topic = self._choose_interest_topic(expertise_topic)
+        user_ids = self.users.extend(n_users, reviewer_quality=reviewer_quality, author_quality=author_quality,
+                                     expertise_topic=expertise_topic, interest_topic=interest_topic,
+                                     is_bot=False, active=True)
+        self.active_users.add(user_ids)
+        if self.tracer is not None: self.tracer.count("users joined", n_users)
+        return user_ids
+    def add_bot_users(self, n_users):
+        topic = self._choose_expertise_topics(n_users)
+        user_ids = self.users.extend(n_users, reviewer_quality=self.PARAMETERS["BOT_TRUE_REVIEWER_QUALITY"],
+                                     author_quality=self.PARAMETERS["BOT_TRUE_AUTHOR_QUALITY"],
+                                     expertise_topic=topic, interest_topic=topic,
+                                     is_bot=True, active=True)
+        self.active_users.add(user_ids)
+        if self.tracer is not None: self.tracer.count("bots joined", n_users)
+        return user_ids
 
     def user_publish_content(self, user):
         topic = user.expertise_topic  # TODO: not always equal to expertise_topic
         content_quality = user.author_quality * (np.dot(user.expertise_topic, topic) + 1) / 2
 
-        content_id = len(self.CONTENT)
-        content = Content(content_id, user.id, topic, float(content_quality), self.CURRENT_YEAR)
-        self.CONTENT.append(content)
-        user.content_ids.append(content_id)
+        content_id = self.content.append(author_id=user.id, quality=content_quality, topic=topic)
+        if self.tracer is not None: self.tracer.count("content published")
+        if self.listeners: self._notify("on_publish", content_id)
     def user_review_content(self, user, content):
         if user.is_bot:
             review_quality = 0
-            evaluation = np.random.rand()  # RANDOMCHOICE
+            evaluation = self.rng.random()  # RANDOMCHOICE
         else:
             review_quality = user.reviewer_quality * (np.dot(user.expertise_topic, content.topic) + 1) / 2
-            evaluation = -1
-            while evaluation < 0 or evaluation > 1:
-                evaluation = content.quality + np.random.randn() * 0.18 / review_quality  # RANDOMCHOICE
-                if not self.PARAMETERS["CONSTRAIN_SCORES_TO_01"]: break
-        review_id = len(self.REVIEWS)
-        review = Review(review_id, user.id, content.id, float(evaluation), float(review_quality), self.CURRENT_YEAR)
-        self.REVIEWS.append(review)
-        user.review_ids.append(review_id)
-        content.review_ids.append(review_id)
+            evaluation = self._noisy_score(content.quality, 0.18 / review_quality)  # RANDOMCHOICE
+        review_id = self.reviews.append(author_id=user.id, content_id=content.id, evaluation=evaluation,
+                                        quality=review_quality)
+        self.reviewed_content.add(content.id)
+        if self.tracer is not None: self._trace_reviews(review_quality)
+        if self.listeners: self._notify("on_review", review_id)
     def user_score_review(self, user, review):
         if user.is_bot:
-            score = np.random.rand()  # RANDOMCHOICE
+            score = self.rng.random()  # RANDOMCHOICE
         else:
-            score = review.quality + np.random.randn() * 0.18 / user.reviewer_quality  # RANDOMCHOICE
-            if self.PARAMETERS["CONSTRAIN_SCORES_TO_01"]: score = np.clip(score, 0, 1)  # TODO: CHANGE TO CLIPPING THE DISTRIBUTION
-            if self.USERS[review.author_id].is_bot:  # non-bot identifying bot
+            on_bot_review = self.users["is_bot"][review.author_id]
+            score = self._noisy_score(review.quality, 0.18 / user.reviewer_quality, "score", traced=not on_bot_review)  # RANDOMCHOICE
+            if on_bot_review:  # non-bot identifying bot
                 score = 0
-        review.scores.append(float(score))
+        score_id = self.scores.append(review_id=review.id, scorer_id=user.id, score=score)
+        if self.tracer is not None: self.tracer.count("scores given")
+        if self.listeners: self._notify("on_score", score_id)
+
+    def _trace_reviews(self, review_quality):
+        self.tracer.count("reviews published", np.size(review_quality))
+        self.tracer.histogram("review quality", review_quality, QUALITY_HISTOGRAM_EDGES)
+
+    # Batched versions of the above: element i of every array argument describes one event,
+    # with the same distributions as calling the single-event method for each i.
+    def users_publish_content(self, user_ids):
+        topic = self.users["expertise_topic"][user_ids]  # TODO: not always equal to expertise_topic
+        # (author_quality * (affinity + 1) / 2, the affinity of the expertise topic with itself being 1)
+        content_quality = self.users["author_quality"][user_ids]
+        content_ids = self.content.extend(len(user_ids), author_id=user_ids, quality=content_quality, topic=topic)
+        if self.tracer is not None: self.tracer.count("content published", len(content_ids))
+        if self.listeners: self._notify("on_publish", content_ids)
+        return content_ids
+    def users_review_content(self, user_ids, content_ids):
+        is_bot = self.users["is_bot"][user_ids]
+        affinity = topic_index.paired_affinities(self.users["expertise_topic"], user_ids, self.content["topic"], content_ids)
+        review_quality = np.where(is_bot, 0, self.users["reviewer_quality"][user_ids] * (affinity + 1) / 2)
+        evaluation = np.empty(len(user_ids))
+        evaluation[is_bot] = self.rng.random(np.count_nonzero(is_bot))  # RANDOMCHOICE
+        genuine = ~is_bot
+        evaluation[genuine] = self._noisy_score(self.content["quality"][content_ids[genuine]], 0.18 / review_quality[genuine])  # RANDOMCHOICE
+        review_ids = self.reviews.extend(len(user_ids), author_id=user_ids, content_id=content_ids, evaluation=evaluation,
+                                         quality=review_quality)
+        self.reviewed_content.add(content_ids)
+        if self.tracer is not None: self._trace_reviews(review_quality)
+        if self.listeners: self._notify("on_review", review_ids)
+        return review_ids
+    def users_score_reviews(self, user_ids, review_ids):
+        is_bot = self.users["is_bot"][user_ids]
+        on_bot_review = self.users["is_bot"][self.reviews["author_id"][review_ids]]
+        # (drawn for every score, but only the scores given by genuine users to genuine reviews keep their draw)
+        score = self._noisy_score(self.reviews["quality"][review_ids], 0.18 / self.users["reviewer_quality"][user_ids], "score",
+                                  traced=~is_bot & ~on_bot_review)  # RANDOMCHOICE
+        score[on_bot_review] = 0  # non-bot identifying bot
+        score[is_bot] = self.rng.random(np.count_nonzero(is_bot))  # RANDOMCHOICE
+        score_ids = self.scores.extend(len(user_ids), review_id=review_ids, scorer_id=user_ids, score=score)
+        if self.tracer is not None: self.tracer.count("scores given", len(score_ids))
+        if self.listeners: self._notify("on_score", score_ids)
+        return score_ids
+
+
+class EntityList:
+    """
+        Read-only sequence of entity views (User, Content or Review) over one of the platform's column tables.
+    """
+    def __init__(self, platform, table, view_class):
+        self._platform = weakref.proxy(platform)  # (no reference cycle: the platform is freed, and its storage lock released, once unused)
+        self._table = table
+        self._view_class = view_class
+
+    def __len__(self):
+        return len(self._table)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self): raise IndexError(i)
+        return self._view_class.view(self._platform, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._view_class.view(self._platform, i)
+
 
 class Content:
     """
         topic is an TOPIC_DIMENSIONALITY-dimensional vector
+        (view of one row of Platform.content)
     """
-    def __init__(self, content_id, author_id, topic, quality, published_year):
+    __slots__ = ("_platform", "id")
+    def __init__(self, platform, content_id):
+        self._platform = platform
         self.id = content_id
-        self.author_id = author_id
-        self.quality = quality
-        self.topic = topic
-        self.review_ids = []
-        self.published_year = published_year
+    @staticmethod
+    def view(platform, content_id):
+        return Content(platform, content_id)
+
+    author_id = property(lambda self: int(self._platform.content["author_id"][self.id]))
+    quality = property(lambda self: float(self._platform.content["quality"][self.id]))
+    topic = property(lambda self: self._platform.content["topic"][self.id])
+    published_year = property(lambda self: int(self._platform.year_of("content", self.id)))
+    @property
+    def review_ids(self):
+        offsets, order = self._platform.content_reviews()
+        return order[offsets[self.id]:offsets[self.id + 1]]
 
 class Review:
     """
         evaluation is the score that the reviewer assigns to the piece of content being reviewed
         quality is the quality of this review
+        (view of one row of Platform.reviews)
     """
-    def __init__(self, review_id, author_id, content_id, evaluation, quality, published_year):
+    __slots__ = ("_platform", "id")
+    def __init__(self, platform, review_id):
+        self._platform = platform
         self.id = review_id
-        self.author_id = author_id
-        self.content_id = content_id
-        self.quality = quality
-        self.evaluation = evaluation
-        self.scores = []
-        self.published_year = published_year
+    @staticmethod
+    def view(platform, review_id):
+        return Review(platform, review_id)
+
+    author_id = property(lambda self: int(self._platform.reviews["author_id"][self.id]))
+    content_id = property(lambda self: int(self._platform.reviews["content_id"][self.id]))
+    quality = property(lambda self: float(self._platform.reviews["quality"][self.id]))
+    evaluation = property(lambda self: float(self._platform.reviews["evaluation"][self.id]))
+    published_year = property(lambda self: int(self._platform.year_of("reviews", self.id)))
+    @property
+    def scores(self):
+        offsets, order = self._platform.review_scores()
+        return self._platform.scores["score"][order[offsets[self.id]:offsets[self.id + 1]]]
 
 
 class User:
@@ -104,25 +426,40 @@ class User:
         reviewer_quality is how good (accurate) this user's reviews are
         expertise_topic is an TOPIC_DIMENSIONALITY-dimensional vector defining the topics this user has expertise in
         interest_topic is an TOPIC_DIMENSIONALITY-dimensional vector defining the topics this user has interest in
+        (view of one row of Platform.users)
     """
-    def __init__(self, user_id, reviewer_quality, author_quality, expertise_topic, interest_topic, joined_year, is_bot=False):
+    __slots__ = ("_platform", "id")
+    def __init__(self, platform, user_id):
+        self._platform = platform
         self.id = user_id
-        self.reviewer_quality = reviewer_quality
-        self.author_quality = author_quality
-        self.expertise_topic = expertise_topic
-        self.interest_topic = interest_topic
-        self.content_ids = []
-        self.review_ids = []
-        self.joined_year = joined_year
-        self.is_bot = is_bot
-        self.active = True
+    @staticmethod
+    def view(platform, user_id):
+        return Bot(platform, user_id) if platform.users["is_bot"][user_id] else User(platform, user_id)
+
+    reviewer_quality = property(lambda self: float(self._platform.users["reviewer_quality"][self.id]))
+    author_quality = property(lambda self: float(self._platform.users["author_quality"][self.id]))
+    expertise_topic = property(lambda self: self._platform.users["expertise_topic"][self.id])
+    interest_topic = property(lambda self: self._platform.users["interest_topic"][self.id])
+    joined_year = property(lambda self: int(self._platform.year_of("users", self.id)))
+    is_bot = property(lambda self: bool(self._platform.users["is_bot"][self.id]))
+    @property
+    def active(self):
+        return bool(self._platform.users["active"][self.id])
+    @active.setter
+    def active(self, active):
+        self._platform.set_users_active(self.id, active)
+    @property
+    def content_ids(self):
+        offsets, order = self._platform.user_content()
+        return order[offsets[self.id]:offsets[self.id + 1]]
+    @property
+    def review_ids(self):
+        offsets, order = self._platform.user_reviews()
+        return order[offsets[self.id]:offsets[self.id + 1]]
 
 
 class Bot(User):
-    def __init__(self, user_id, joined_year):
-        topic = np.zeros(PLATFORM_PARAMETERS["TOPIC_DIMENSIONALITY"])
-        topic[0] = 1  # RANDOMCHOICE
-        super().__init__(user_id,
-                         PLATFORM_PARAMETERS["BOT_TRUE_REVIEWER_QUALITY"],
-                         PLATFORM_PARAMETERS["BOT_TRUE_AUTHOR_QUALITY"],
-                         topic, topic, self.CURRENT_YEAR, is_bot=True)
\ No newline at end of file
+    """
+        User with BOT_TRUE_REVIEWER_QUALITY and BOT_TRUE_AUTHOR_QUALITY, whose reviews and scores are random
+    """
+    __slots__ = ()
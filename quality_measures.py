@@ -1,5 +1,14 @@
+import bisect
+import threading
+import time
+import weakref
 import numpy as np
 import platform_structure
+from columnar_store import ColumnTable
+from instrumentation import timed
+
+# Rows of reviews / scores read at once by the streaming passes over out-of-core platforms (see SharedIntermediates.bincount)
+STREAM_CHUNK_ROWS = 1 << 22
 
 class QualityMeasure():
     def __init__(self, name="Quality Measure (unnamed)"):
@@ -7,33 +16,69 @@ class QualityMeasure():
         self.content_quality_estimates = None
         self.content_quality_estimates_commitment_order = None
         self.name = name
+        self.shared = None  # SharedIntermediates in use during calculate_estimates
 
     def clear_scores(self, platform):
         self.reviewer_quality_estimates = [None] * len(platform.USERS)
         self.content_quality_estimates = [None] * len(platform.CONTENT)
         self.content_quality_estimates_commitment_order = np.arange(len(platform.USERS))
 
+    # Attributes holding what the last calculation keeps for the next one on the same platform (see update_estimates),
+    # with a weak reference to that platform: copies (e.g. pickled to a trial process) start without them
+    _PLATFORM_STATE = ()
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in self._PLATFORM_STATE: state[name] = None
+        return state
+
+    def dependencies(self):
+        # Measures whose estimates must be calculated (on the same platform) before this one's
+        return []
+    def _intermediates(self, platform):
+        # The intermediates shared with other measures during calculate_estimates, otherwise private ones
+        if self.shared is not None and self.shared.platform is platform: return self.shared
+        return SharedIntermediates(platform)
+
     def calculate_reviewer_estimates(self, platform):
-        for reviewer in platform.USERS:
-            # Average all scores that other reviewers gave to this reviewer
-            scores = []
-            for review_id in reviewer.review_ids:
-                scores.extend(platform.REVIEWS[review_id].scores)
-            self.reviewer_quality_estimates[reviewer.id] = None if len(scores) == 0 else float(np.mean(scores))
+        # Average all scores that other reviewers gave to this reviewer (see SharedIntermediates.reviewer_reputations)
+        self.reviewer_quality_estimates = self._intermediates(platform).reviewer_quality_estimates()
     def calculate_reviewer_weights(self, platform):
         pass
     def calculate_content_estimates(self, platform):
         pass
-    def calculate_estimates(self, platform):
-        self.clear_scores(platform)
-        # Step 1: Calculate reviewer reputations
-        self.calculate_reviewer_estimates(platform)
-        # Step 2: Calculate content quality estimates
-        self.calculate_reviewer_weights(platform)
-        self.calculate_content_estimates(platform)
-        self.calculate_content_quality_estimates_commitment_order(platform)
-
-    def evaluate_performance(self, platform, commitment_resolution=0.1):
+    def calculate_estimates(self, platform, timings=None, shared=None):
+        """
+            timings: optional dict, receives the seconds spent in each phase
+            shared: SharedIntermediates of the platform, to reuse what other measures already computed (see measure_engine)
+        """
+        self.shared = shared if shared is not None else SharedIntermediates(platform)
+        try:
+            self.clear_scores(platform)
+            # Step 1: Calculate reviewer reputations
+            with timed(timings, "calculate_reviewer_estimates"):
+                self.calculate_reviewer_estimates(platform)
+            # Step 2: Calculate content quality estimates
+            with timed(timings, "calculate_reviewer_weights"):
+                self.calculate_reviewer_weights(platform)
+            with timed(timings, "calculate_content_estimates"):
+                self.calculate_content_estimates(platform)
+            with timed(timings, "calculate_content_quality_estimates_commitment_order"):
+                self.calculate_content_quality_estimates_commitment_order(platform)
+        finally:
+            self.shared = None
+
+    def update_estimates(self, platform, since_year=None, timings=None, shared=None):
+        """
+            Brings the estimates up to date after the platform grew (e.g. simulation.run continued it), recalculating
+            only what the entities published or joined in since_year or later change. since_year defaults to the
+            platform's SIMULATED_YEARS when the estimates were last calculated (the watermark of the last calculation),
+            the only year an incremental update can start from: with any other since_year, or another platform, the
+            estimates are recalculated from scratch.
+            Measures that cannot update their estimates incrementally recalculate them all (as here).
+        """
+        self.calculate_estimates(platform, timings=timings, shared=shared)
+
+    def evaluate_performance(self, platform, commitment_resolution=0.1, timings=None):
         """
             Returns
             (1) Correlation between true and estimated reviewer quality
@@ -41,28 +86,29 @@ class QualityMeasure():
 
             (3) array of values specifying various proportions of papers with committed scores
             (4) array of correlations between true and estimated content quality for committed papers from (3)
+            With commitment_resolution=None, (3) and (4) cover every possible commitment (1, 2, ... papers).
+            timings: optional dict, receives the seconds spent in each phase
         """
         # Step 1:
-        true_qualities = []
-        estimated_qualities = []
-        for i in range(len(platform.USERS)):
-            if self.reviewer_quality_estimates[i] is None: continue
-            true_qualities.append(platform.USERS[i].reviewer_quality)
-            estimated_qualities.append(self.reviewer_quality_estimates[i])
-        reviewer_estimate_correlation = np.corrcoef(true_qualities, estimated_qualities)[1, 0]
-        reviewer_estimate_coverage = len(true_qualities) / len(platform.CONTENT)
+        with timed(timings, "evaluate_reviewer_estimates"):
+            reviewer_quality_estimates = _floats(self.reviewer_quality_estimates)
+            has_estimate = ~np.isnan(reviewer_quality_estimates)
+            reviewer_estimate_correlation = np.corrcoef(platform.users["reviewer_quality"][has_estimate], reviewer_quality_estimates[has_estimate])[1, 0]
+            reviewer_estimate_coverage = np.count_nonzero(has_estimate) / len(platform.CONTENT)
 
         # Check the correlation for various levels of commitments at a specified resolution up to maximum possible commitment
-        maximum_commitment = len([x for x in self.content_quality_estimates if x is not None])
-        commitment_resolution = int(commitment_resolution * len(platform.CONTENT))
-        considered_commitments = list(np.arange(commitment_resolution, maximum_commitment, commitment_resolution))
-        if considered_commitments[-1] < maximum_commitment: considered_commitments += [maximum_commitment]
-        content_estimate_correlations = np.zeros(len(considered_commitments))
-        for commitment_i, commitment in enumerate(considered_commitments):
-            indexes = self.content_quality_estimates_commitment_order[:commitment]
-            true_qualities = np.array([platform.CONTENT[index].quality for index in indexes])
-            estimated_qualities = np.array([self.content_quality_estimates[index] for index in indexes])
-            content_estimate_correlations[commitment_i] = np.corrcoef(true_qualities, estimated_qualities)[1, 0]
+        with timed(timings, "evaluate_content_estimates"):
+            content_quality_estimates = _floats(self.content_quality_estimates)
+            maximum_commitment = sum(x is not None for x in self.content_quality_estimates)
+            if commitment_resolution is None:
+                considered_commitments = np.arange(1, maximum_commitment + 1)
+            else:
+                commitment_resolution = int(commitment_resolution * len(platform.CONTENT))
+                considered_commitments = list(np.arange(commitment_resolution, maximum_commitment, commitment_resolution))
+                if not considered_commitments or considered_commitments[-1] < maximum_commitment: considered_commitments += [maximum_commitment]
+            indexes = self.content_quality_estimates_commitment_order[:maximum_commitment]
+            content_estimate_correlations = _prefix_correlations(platform.content["quality"][indexes], content_quality_estimates[indexes])
+            content_estimate_correlations = content_estimate_correlations[np.asarray(considered_commitments, dtype=np.int64) - 1]
 
         return reviewer_estimate_correlation, reviewer_estimate_coverage, \
                np.array(considered_commitments, dtype=float) / len(platform.CONTENT), content_estimate_correlations
@@ -74,35 +120,102 @@ class SimpleMeanThresholdedReviewers(QualityMeasure):
             But only considers reviews posted by reviewers with reputation > threshold (in percentile)
             Note that the weighting function must be specified in a child class.
     """
+    _PLATFORM_STATE = ("_update_state",)
     def __init__(self, threshold_percentile, name=None):
         self.threshold_percentile = threshold_percentile
         self.reviewer_weights = None
-        self.selected_reviews_for_content = None
+        self.selected_reviewers = None
+        self.n_selected_reviews_for_content = None
+        self._update_state = None  # what update_estimates starts from (see calculate_content_estimates)
         if name is None: name = f"mean of top {int(100-threshold_percentile)}% reviewers"
         super().__init__(name=name)
     def calculate_reviewer_weights(self, platform):
         # Do not weigh reviews; assign equal weight to all reviews.
-        self.reviewer_weights = [1 for user in platform.USERS]
+        self.reviewer_weights = np.ones(len(platform.USERS))
     def calculate_content_estimates(self, platform):
-        reviewer_reputation_threshold = np.percentile([x for x in self.reviewer_quality_estimates if x is not None], self.threshold_percentile)
-        self.selected_reviews_for_content = []
-        for content in platform.CONTENT:
-            # Average all scores that other reviewers gave to this content
-            evaluations = []
-            weights = []
-            self.selected_reviews_for_content.append([])
-            for review_id in content.review_ids:
-                review = platform.REVIEWS[review_id]
-                author_reputation_estimate = self.reviewer_quality_estimates[review.author_id]
-                if author_reputation_estimate is not None and author_reputation_estimate >= reviewer_reputation_threshold\
-                        and self.reviewer_weights[review.author_id] is not None:
-                    evaluations.append(review.evaluation)
-                    weights.append(self.reviewer_weights[review.author_id])
-                    self.selected_reviews_for_content[-1].append(review_id)
-            self.content_quality_estimates[content.id] = None if len(evaluations) == 0 else float(np.average(evaluations, weights=weights))
+        shared = self._intermediates(platform)
+        reviewer_quality_estimates = shared.floats(self.reviewer_quality_estimates)
+        has_estimate = ~np.isnan(reviewer_quality_estimates)
+        reviewer_reputation_threshold = shared.reviewer_percentile(self.reviewer_quality_estimates, self.threshold_percentile)
+        # Only reviews by reviewers with a reputation above the threshold (and a weight) are considered
+        self.selected_reviewers = has_estimate & ~np.isnan(self.reviewer_weights)
+        self.selected_reviewers[has_estimate] &= reviewer_quality_estimates[has_estimate] >= reviewer_reputation_threshold
+        weights = np.where(self.selected_reviewers, self.reviewer_weights, 0)
+        # Weighted average of the selected evaluations of every content: sum_u w_u * (sum of u's evaluations) / sum_u w_u * (# of u's reviews)
+        self.n_selected_reviews_for_content = np.rint(shared.content_weight_sums(self.selected_reviewers.astype(float))).astype(np.int64)
+        weighted_evaluation_sums, weight_sums = shared.content_weighted_evaluation_sums(weights), shared.content_weight_sums(weights)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            content_quality_estimates = weighted_evaluation_sums / weight_sums
+        self.content_quality_estimates = _optional_floats(content_quality_estimates, self.n_selected_reviews_for_content > 0)
+        self._update_state = {"platform": weakref.ref(platform), "since_year": platform.SIMULATED_YEARS, "score_sums": shared.reviewer_score_sums(),
+                              "score_counts": shared.reviewer_score_counts(), "weights": weights,
+                              "weighted_evaluation_sums": weighted_evaluation_sums, "weight_sums": weight_sums}
     def calculate_content_quality_estimates_commitment_order(self, platform):
         # commit scores according to # reviews (highest first)
-        self.content_quality_estimates_commitment_order = np.argsort([len(x) for x in self.selected_reviews_for_content])[::-1]
+        self.content_quality_estimates_commitment_order = np.argsort(self.n_selected_reviews_for_content)[::-1]
+
+    def update_estimates(self, platform, since_year=None, timings=None, shared=None):
+        """
+            Starts from the sums kept by the last calculation and only aggregates the new scores and the reviews whose
+            weight changed, instead of every review and score of the platform:
+                - reviewers: score sums and counts += the new scores (see SharedIntermediates.updated_reviewer_scores)
+                - the threshold and weights are recalculated (O(users)); the old reviews of every reviewer whose
+                  weight changed (e.g. who crossed the threshold) are re-weighted, and the new reviews added
+                - content: weighted evaluation sums and weight sums += those reviews' changes
+            The estimates equal those of calculate_estimates up to rounding (the sums are accumulated in another order).
+        """
+        state = self._update_state
+        # The kept sums cover exactly the rows of that platform before state["since_year"]: from anywhere else, start over
+        if state is None or state["platform"]() is not platform or since_year not in (None, state["since_year"]):
+            return super().update_estimates(platform, since_year, timings=timings, shared=shared)
+        since_year = state["since_year"]
+        n_users, n_content = len(platform.users), len(platform.content)
+        first_user_id = platform.first_id_since("users", since_year)
+        first_review_id, first_score_id = platform.first_id_since("reviews", since_year), platform.first_id_since("scores", since_year)
+        reviews = platform.reviews
+
+        shared = shared if shared is not None else SharedIntermediates(platform)
+        with timed(timings, "calculate_reviewer_estimates"):
+            score_sums, score_counts = shared.updated_reviewer_scores(state["score_sums"], state["score_counts"], first_score_id)
+            self.reviewer_quality_estimates = shared.reviewer_quality_estimates()
+        with timed(timings, "calculate_reviewer_weights"):
+            self.calculate_reviewer_weights(platform)
+        with timed(timings, "calculate_content_estimates"):
+            reputations = shared.reviewer_reputations()
+            has_estimate = ~np.isnan(reputations)
+            previously_selected = _grown(self.selected_reviewers, n_users)
+            self.selected_reviewers = has_estimate & ~np.isnan(self.reviewer_weights)
+            self.selected_reviewers[has_estimate] &= reputations[has_estimate] >= shared.reviewer_percentile(self.reviewer_quality_estimates, self.threshold_percentile)
+            weights, previous_weights = np.where(self.selected_reviewers, self.reviewer_weights, 0), _grown(state["weights"], n_users)
+            if shared.streaming:
+                # Out of core, the reviews are read chunk by chunk from disk anyway: re-weigh them all in one pass each
+                # (the in-memory index of the reviews of every reviewer is not built); scores are still only added
+                weighted_evaluation_sums, weight_sums = shared.content_weighted_evaluation_sums(weights), shared.content_weight_sums(weights)
+                self.n_selected_reviews_for_content = np.rint(shared.content_weight_sums(self.selected_reviewers.astype(float))).astype(np.int64)
+            else:
+                # Reviews whose weight changed: the old reviews of re-weighted reviewers, and all new reviews
+                reweighted = np.flatnonzero(weights[:first_user_id] != previous_weights[:first_user_id])
+                offsets, order = platform.user_reviews()
+                n_reviews = offsets[reweighted + 1] - offsets[reweighted]
+                first_positions = offsets[reweighted] - (np.cumsum(n_reviews) - n_reviews)
+                review_ids = order[np.repeat(first_positions, n_reviews) + np.arange(n_reviews.sum())]
+                review_ids = np.concatenate([review_ids[review_ids < first_review_id], np.arange(first_review_id, len(reviews))])
+                authors, content_ids = reviews["author_id"][review_ids], reviews["content_id"][review_ids]
+                is_new = review_ids >= first_review_id
+                weight_changes = weights[authors] - np.where(is_new, 0, previous_weights[authors])
+                selection_changes = self.selected_reviewers[authors].astype(np.int64) - (~is_new & previously_selected[authors])
+                weighted_evaluation_sums = _grown(state["weighted_evaluation_sums"], n_content) + np.bincount(
+                    content_ids, weights=weight_changes * reviews["evaluation"][review_ids], minlength=n_content)
+                weight_sums = _grown(state["weight_sums"], n_content) + np.bincount(content_ids, weights=weight_changes, minlength=n_content)
+                self.n_selected_reviews_for_content = _grown(self.n_selected_reviews_for_content, n_content) + np.rint(
+                    np.bincount(content_ids, weights=selection_changes, minlength=n_content)).astype(np.int64)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                content_quality_estimates = weighted_evaluation_sums / weight_sums
+            self.content_quality_estimates = _optional_floats(content_quality_estimates, self.n_selected_reviews_for_content > 0)
+            self._update_state = {"platform": weakref.ref(platform), "since_year": platform.SIMULATED_YEARS, "score_sums": score_sums, "score_counts": score_counts,
+                                  "weights": weights, "weighted_evaluation_sums": weighted_evaluation_sums, "weight_sums": weight_sums}
+        with timed(timings, "calculate_content_quality_estimates_commitment_order"):
+            self.calculate_content_quality_estimates_commitment_order(platform)
 
 
 class SimpleMean(SimpleMeanThresholdedReviewers):
@@ -128,21 +241,18 @@ class BayesWeightingOracle(SimpleMeanThresholdedReviewers):
         super().__init__(threshold_percentile, name=name)
 
     def calculate_reviewer_weights(self, platform):
-        self.reviewer_SD_estimates = [0.18/user.reviewer_quality for user in platform.USERS]
-        self.reviewer_weights = [1 / self.reviewer_SD_estimates[user.id] ** 2 for user in platform.USERS]
+        self.reviewer_SD_estimates = 0.18 / platform.users["reviewer_quality"]
+        self.reviewer_weights = 1 / self.reviewer_SD_estimates ** 2
 
     def calculate_content_quality_estimates_commitment_order(self, platform):
-        estimated_SDs = []
-        for content_i, content in enumerate(platform.CONTENT):
-            estimated_SD = 0
-            for review_id in self.selected_reviews_for_content[content_i]:
-                reviewer_weight = self.reviewer_weights[platform.REVIEWS[review_id].author_id]
-                if reviewer_weight is None: continue
-                estimated_SD += reviewer_weight
-            if estimated_SD > 0:
-                estimated_SDs.append(1/estimated_SD)
-            else:
-                estimated_SDs.append(10**8) # simply huge number to put it at the back of the list
+        # SD of the weighted mean is 1 / (sum of the weights of the selected reviews).
+        # Summed review by review (bincount accumulates in review order), so that contents whose reviewers have equal weights tie exactly.
+        def review_weights(reviews, rows):
+            review_authors = reviews["author_id"][rows]
+            return np.where(self.selected_reviewers[review_authors], self.reviewer_weights[review_authors], 0)
+        weight_sums = self._intermediates(platform).bincount(platform.reviews, _review_content, review_weights, len(platform.CONTENT))
+        estimated_SDs = np.full(len(platform.CONTENT), np.inf)  # content without estimate goes to the back of the list (after bot-reviewed content too)
+        np.divide(1, weight_sums, out=estimated_SDs, where=weight_sums > 0)
         self.content_quality_estimates_commitment_order = np.argsort(estimated_SDs)
 
 
@@ -161,56 +271,513 @@ class BayesWeightingMeasureEstimate(BayesWeightingOracle):
         if threshold_percentile>0: name += f" (top {int(100-threshold_percentile)}% reviewers)"
         super().__init__(threshold_percentile, name=name)
 
+    def dependencies(self):
+        return [self.estimating_measure]
+
+    def update_estimates(self, platform, since_year=None, timings=None, shared=None):
+        # The weights of all reviewers follow the estimating measure's (updated) estimates: recalculate everything
+        QualityMeasure.update_estimates(self, platform, since_year, timings=timings, shared=shared)
+
     def calculate_reviewer_weights(self, platform):
         """
             Assumes that the paper qualities were already calculated according to the estimating measure
         """
-        # Step 1: Split users into bins according to their estimated reputation
+        # Step 1: Split users into bins according to their estimated reputation.
+        #         A reviewer's percentile is the fraction of estimates strictly below theirs: a binary search in the sorted estimates.
         reviewer_percentile_bins = np.arange(0, 1, self.reviewer_percentile_bin_width)
-        nn_reviewer_quality_estimates = np.array([x for x in self.reviewer_quality_estimates if x is not None])
-        estimated_reviewer_percentiles = [None] * len(platform.USERS)
-        user_bins = [None] * len(platform.USERS)
-        for user in platform.USERS:
-            user_quality_estimate = self.reviewer_quality_estimates[user.id]
-            if user_quality_estimate is None: continue
-            estimated_reviewer_percentile = np.mean(nn_reviewer_quality_estimates<user_quality_estimate)
-            bin_n = int(estimated_reviewer_percentile // self.reviewer_percentile_bin_width)
-            estimated_reviewer_percentiles.append(estimated_reviewer_percentile)
-            user_bins[user.id] = bin_n
+        n_bins = len(reviewer_percentile_bins)
+        shared = self._intermediates(platform)
+        reviewer_quality_estimates = shared.floats(self.reviewer_quality_estimates)
+        has_estimate = ~np.isnan(reviewer_quality_estimates)
+        nn_reviewer_quality_estimates = reviewer_quality_estimates[has_estimate]
+        estimated_reviewer_percentiles = np.searchsorted(np.sort(nn_reviewer_quality_estimates), nn_reviewer_quality_estimates,
+                                                         side="left") / len(nn_reviewer_quality_estimates)
+        bins = np.full(len(platform.USERS), -1, dtype=np.int64)
+        bins[has_estimate] = estimated_reviewer_percentiles // self.reviewer_percentile_bin_width
         # Step 2: Estimate SD of reviewers in every bin based on how their scores
-        #         distribute around the estimating measure's scores of committed papers
-        distributions_for_bin = [[] for bin in reviewer_percentile_bins]
+        #         distribute around the estimating measure's scores of committed papers.
         considered_content_n = int(len(self.estimating_measure.content_quality_estimates) * self.estimating_measure_commitment)
         considered_content_ids = self.estimating_measure.content_quality_estimates_commitment_order[:considered_content_n]
-        for content_id in considered_content_ids:
-            content = platform.CONTENT[content_id]
-            for review_id in content.review_ids:
-                review = platform.REVIEWS[review_id]
-                user_bin = user_bins[review.author_id]
-                if user_bin is None: continue
-                distributions_for_bin[user_bin].append(review.evaluation - self.estimating_measure.content_quality_estimates[content_id])
-        # Step 3: Use distributions by bin to calculate SD of every bin (and thus every reviewer in the bin)
-        self.means_for_bin = [np.mean(distributions_for_bin[bin_i]) for bin_i in range(len(reviewer_percentile_bins))]
-        self.sds_for_bin = [np.std(distributions_for_bin[bin_i]) for bin_i in range(len(reviewer_percentile_bins))]
-        self.n_for_bin = [len(distributions_for_bin[bin_i]) for bin_i in range(len(reviewer_percentile_bins))]
-        self.reviewer_SD_estimates = [None] * len(platform.USERS)
-        self.reviewer_weights = [None] * len(platform.USERS)
-        for user in platform.USERS:
-            if user_bins[user.id] is None: continue
-            self.reviewer_SD_estimates[user.id] = self.sds_for_bin[user_bins[user.id]]
-            self.reviewer_weights[user.id] = 1/self.sds_for_bin[user_bins[user.id]] ** 2
-        self.user_bins = user_bins
+        if shared.streaming:
+            self._streamed_bin_statistics(platform, shared, bins, n_bins, considered_content_ids)
+        else:
+            self._bin_statistics(platform, bins, n_bins, considered_content_ids)
+        self.reviewer_SD_estimates = np.full(len(platform.USERS), np.nan)
+        self.reviewer_SD_estimates[has_estimate] = np.array(self.sds_for_bin)[bins[has_estimate]]
+        with np.errstate(divide="ignore"):
+            self.reviewer_weights = 1 / self.reviewer_SD_estimates ** 2
+        self.user_bins = [None if user_bin < 0 else user_bin for user_bin in bins.tolist()]
 
-    def calculate_content_quality_estimates_commitment_order(self, platform):
-        estimated_SDs = []
-        for content_i, content in enumerate(platform.CONTENT):
-            estimated_SD = 0
-            for review_id in self.selected_reviews_for_content[content_i]:
-                reviewer_weight = self.reviewer_weights[platform.REVIEWS[review_id].author_id]
-                if reviewer_weight is None: continue
-                estimated_SD += reviewer_weight
-            if estimated_SD > 0:
-                estimated_SDs.append(1/estimated_SD)
+    def _bin_statistics(self, platform, bins, n_bins, considered_content_ids):
+        # Residuals of the reviews of the committed papers, in commitment order (then in review order)
+        offsets, order = platform.content_reviews()
+        n_reviews = offsets[considered_content_ids + 1] - offsets[considered_content_ids]
+        first_positions = offsets[considered_content_ids] - (np.cumsum(n_reviews) - n_reviews)
+        review_ids = order[np.repeat(first_positions, n_reviews) + np.arange(n_reviews.sum())]
+        residuals = platform.reviews["evaluation"][review_ids] - np.repeat(
+            _floats(self.estimating_measure.content_quality_estimates)[considered_content_ids], n_reviews)
+        review_bins = bins[platform.reviews["author_id"][review_ids]]
+        residuals, review_bins = residuals[review_bins >= 0], review_bins[review_bins >= 0]
+        # Step 3: Use distributions by bin to calculate SD of every bin (and thus every reviewer in the bin).
+        #         Residuals are grouped by bin with a stable sort, so each bin's residuals keep their order.
+        n_for_bin = np.bincount(review_bins, minlength=n_bins)
+        bin_offsets = np.concatenate([[0], np.cumsum(n_for_bin)])
+        residuals = residuals[np.argsort(review_bins, kind="stable")]
+        distributions_for_bin = [residuals[bin_offsets[bin_i]:bin_offsets[bin_i + 1]] for bin_i in range(n_bins)]
+        self.means_for_bin = [np.mean(distributions_for_bin[bin_i]) for bin_i in range(n_bins)]
+        self.sds_for_bin = [np.std(distributions_for_bin[bin_i]) for bin_i in range(n_bins)]
+        self.n_for_bin = n_for_bin[:n_bins].tolist()
+
+    def _streamed_bin_statistics(self, platform, shared, bins, n_bins, considered_content_ids):
+        # Same statistics from per-bin count, sum and sum of squares of the residuals, accumulated over chunks of the
+        # reviews (reviews of uncommitted content or by reviewers without a bin go to the extra bin n_bins)
+        committed = np.zeros(len(platform.CONTENT), dtype=bool)
+        committed[considered_content_ids] = True
+        content_quality_estimates = _floats(self.estimating_measure.content_quality_estimates)
+        def review_bins(reviews, rows):
+            author_bins = bins[reviews["author_id"][rows]]
+            return np.where(committed[reviews["content_id"][rows]] & (author_bins >= 0), author_bins, n_bins)
+        def residuals(reviews, rows):
+            return reviews["evaluation"][rows] - content_quality_estimates[reviews["content_id"][rows]]
+        n_for_bin = shared.bincount(platform.reviews, review_bins, minlength=n_bins + 1)[:n_bins]
+        sums = shared.bincount(platform.reviews, review_bins, residuals, n_bins + 1)[:n_bins]
+        squares = shared.bincount(platform.reviews, review_bins, lambda reviews, rows: residuals(reviews, rows) ** 2, n_bins + 1)[:n_bins]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = sums / n_for_bin
+            self.means_for_bin = means.tolist()
+            self.sds_for_bin = np.sqrt(np.maximum(squares / n_for_bin - means ** 2, 0)).tolist()
+        self.n_for_bin = n_for_bin.tolist()
+
+
+class ReputationPropagation(BayesWeightingOracle):
+    """
+        Reviewer reputations and content estimates as the fixed point of
+            reputation of u = mean of the scores given to u's reviews, weighted by their scorer's reputation ** score_weight_power
+            quality of c    = mean of c's evaluations, weighted by their reviewer's reputation ** review_weight_power
+        so that the scores given by reviewers with a bad reputation (e.g. bots) count less, which changes the
+        reputations they gave, and so on. Scorers without a reputation weigh as the mean reputation; reviews by
+        reviewers without one are ignored. With review_weight_power=2 the review weights mirror BayesWeightingOracle's
+        (1 / SD^2, the SD of a review being inversely proportional to its reviewer's quality).
+        Both steps are sparse matrix-vector products (see SharedIntermediates); they alternate, starting from the plain
+        score means (or, with warm_start, from the reputations of the previous calculation on the same platform), until
+        no reputation and no estimate moves by more than tolerance, or max_iterations.
+        After calculate_estimates: n_iterations, converged, convergence_seconds and residuals (largest change of
+        every iteration).
+    """
+    _PLATFORM_STATE = ("_update_state", "_reputations_platform")
+    def __init__(self, threshold_percentile=0, score_weight_power=1, review_weight_power=2, tolerance=1e-6, max_iterations=100,
+                 warm_start=True, name="reputation propagation"):
+        self.score_weight_power = score_weight_power
+        self.review_weight_power = review_weight_power
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.warm_start = warm_start
+        self.n_iterations = self.converged = self.convergence_seconds = self.residuals = None
+        self._reputations = None
+        self._reputations_platform = None  # weak reference to the platform of _reputations (warm starts only start from it)
+        super().__init__(threshold_percentile, name=name)
+
+    def update_estimates(self, platform, since_year=None, timings=None, shared=None):
+        # Every new score moves the fixed point: recalculate (warm-started) instead
+        QualityMeasure.update_estimates(self, platform, since_year, timings=timings, shared=shared)
+
+    # Reputation floor of the weights, so that a reviewer whose scorers all have a reputation of 0 still gets a mean
+    MIN_WEIGHTED_REPUTATION = 1e-6
+    def _weights(self, reputations, power, default):
+        # reputation ** power; default where there is no reputation
+        with np.errstate(invalid="ignore"):
+            return np.where(np.isnan(reputations), default, np.fmax(reputations, self.MIN_WEIGHTED_REPUTATION) ** power)
+
+    def calculate_reviewer_estimates(self, platform):
+        shared = self._intermediates(platform)
+        reputations = shared.reviewer_reputations().copy()
+        has_reputation = ~np.isnan(reputations)
+        if self.warm_start and self._reputations_platform is not None and self._reputations_platform() is platform \
+                and len(self._reputations) <= len(reputations):
+            known = has_reputation[:len(self._reputations)] & ~np.isnan(self._reputations)
+            reputations[:len(self._reputations)][known] = self._reputations[known]
+        start = time.perf_counter()
+        self.residuals, self.converged = [], False
+        content_quality_estimates = None
+        for self.n_iterations in range(1, self.max_iterations + 1):
+            scorer_weights = self._weights(reputations, self.score_weight_power, np.mean(reputations[has_reputation]) ** self.score_weight_power)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                next_reputations = shared.reviewer_weighted_score_sums(scorer_weights) / shared.reviewer_score_weight_sums(scorer_weights)
+                review_weights = self._weights(next_reputations, self.review_weight_power, 0)
+                next_content_quality_estimates = shared.content_weighted_evaluation_sums(review_weights) / shared.content_weight_sums(review_weights)
+            residual = _largest_change(reputations, next_reputations)
+            if content_quality_estimates is not None:
+                residual = max(residual, _largest_change(content_quality_estimates, next_content_quality_estimates))
+            reputations, content_quality_estimates = next_reputations, next_content_quality_estimates
+            self.residuals.append(residual)
+            if self.n_iterations > 1 and residual <= self.tolerance:
+                self.converged = True
+                break
+        self.convergence_seconds = time.perf_counter() - start
+        self._reputations, self._reputations_platform = reputations, weakref.ref(platform)
+        self.reviewer_quality_estimates = _optional_floats(reputations)
+
+    def calculate_reviewer_weights(self, platform):
+        # The weights of the last iteration (NaN without reputation: not selected)
+        self.reviewer_weights = self._weights(self._reputations, self.review_weight_power, np.nan)
+
+
+class IncrementalQualityMeasure(SimpleMeanThresholdedReviewers):
+    """
+        SimpleMeanThresholdedReviewers whose estimates stay current while the platform changes, instead of being
+        recalculated from scratch. attach(platform) registers it as a platform listener; the platform then calls
+        on_publish / on_review / on_score with the ids of every batch of new events (and attach replays the events
+        that already happened, as one batch each).
+        Kept up to date per batch, with array operations over its events:
+            - running sum and count of the scores of every reviewer (-> reputation)
+            - running sum and count of the selected evaluations of every content (-> content estimate)
+            - the reviews of every reviewer, as linked lists (_reviewers["last_review"] -> _review_links["previous_review"])
+        and, per reviewer whose reputation changed, the reputations in an order-statistics structure (-> percentile
+        threshold in O(log U)). When the threshold moves, only the reviewers whose reputation lies between the old and
+        the new threshold can change selection, so a batch costs O(events + changed reviewers * log U + reviews of the
+        reviewers whose selection flips).
+        calculate_estimates(platform) fills the usual estimate attributes from this state without recalculating it.
+    """
+    def __init__(self, threshold_percentile, name=None):
+        if name is None: name = f"incremental mean of top {int(100-threshold_percentile)}% reviewers"
+        super().__init__(threshold_percentile, name=name)
+        # (review ids in the links are shifted by one: 0 ends a list)
+        self._reviewers = ColumnTable({"score_sum": (np.float64, ()), "score_count": (np.int64, ()), "selected": (np.bool_, ()),
+                                       "last_review": (np.int64, ())})
+        self._review_links = ColumnTable({"previous_review": (np.int64, ())})
+        self._content = ColumnTable({"evaluation_sum": (np.float64, ()), "selected_count": (np.int64, ())})
+        self._reputations = _SortedMultiset()  # (reputation, reviewer id) of reviewers with at least one score
+        self._threshold = None
+
+    def attach(self, platform):
+        platform.add_listener(self)
+        self.on_publish(platform, np.arange(len(platform.content)))
+        self.on_review(platform, np.arange(len(platform.reviews)))
+        self.on_score(platform, np.arange(len(platform.scores)))
+
+    def _reputation(self, user_id):
+        return self._reviewers["score_sum"][user_id] / self._reviewers["score_count"][user_id]
+    def _ensure_reviewers(self, platform):
+        self._reviewers.extend(len(platform.users) - len(self._reviewers))
+    def _review_ids_of(self, user_id):
+        review_ids, link = [], self._reviewers["last_review"][user_id]
+        while link:
+            review_ids.append(link - 1)
+            link = self._review_links["previous_review"][link - 1]
+        return review_ids
+
+    def on_publish(self, platform, content_ids):
+        self._content.extend(len(platform.content) - len(self._content))
+    def on_review(self, platform, review_ids):
+        self._ensure_reviewers(platform)
+        self._review_links.extend(len(platform.reviews) - len(self._review_links))
+        author_ids = platform.reviews["author_id"][review_ids]
+        # Prepend the reviews to their authors' lists, grouped by author (in review order within a group)
+        order = np.argsort(author_ids, kind="stable")
+        sorted_author_ids, sorted_links = author_ids[order], review_ids[order] + 1
+        follows_same_author = np.zeros(len(order), dtype=bool)
+        follows_same_author[1:] = sorted_author_ids[1:] == sorted_author_ids[:-1]
+        self._review_links["previous_review"][review_ids[order]] = np.where(
+            follows_same_author, np.roll(sorted_links, 1), self._reviewers["last_review"][sorted_author_ids])
+        ends_group = np.append(~follows_same_author[1:], True)
+        self._reviewers["last_review"][sorted_author_ids[ends_group]] = sorted_links[ends_group]
+
+        selected = self._reviewers["selected"][author_ids]
+        content_ids = platform.reviews["content_id"][review_ids[selected]]
+        np.add.at(self._content["evaluation_sum"], content_ids, platform.reviews["evaluation"][review_ids[selected]])
+        np.add.at(self._content["selected_count"], content_ids, 1)
+    def on_score(self, platform, score_ids):
+        if len(score_ids) == 0: return
+        self._ensure_reviewers(platform)
+        author_ids = platform.reviews["author_id"][platform.scores["review_id"][score_ids]]
+        changed_reviewer_ids = np.unique(author_ids)
+        for user_id in changed_reviewer_ids[self._reviewers["score_count"][changed_reviewer_ids] > 0].tolist():
+            self._reputations.remove((self._reputation(user_id), user_id))
+        # (np.add.at adds in score order: the same sums as one score at a time)
+        np.add.at(self._reviewers["score_sum"], author_ids, platform.scores["score"][score_ids])
+        np.add.at(self._reviewers["score_count"], author_ids, 1)
+        for user_id in changed_reviewer_ids.tolist():
+            self._reputations.add((self._reputation(user_id), user_id))
+        self._update_selection(platform, changed_reviewer_ids)
+
+    def _percentile_threshold(self):
+        # np.percentile (linear interpolation) of the reputations, from the two order statistics around it
+        n = len(self._reputations)
+        virtual_index = (n - 1) * (self.threshold_percentile / 100)
+        previous_index = int(np.floor(virtual_index))
+        gamma = virtual_index - previous_index
+        a, b = self._reputations[previous_index][0], self._reputations[min(previous_index + 1, n - 1)][0]
+        return b - (b - a) * (1 - gamma) if gamma >= 0.5 else a + (b - a) * gamma
+    def _update_selection(self, platform, changed_reviewer_ids):
+        previous_threshold, self._threshold = self._threshold, self._percentile_threshold()
+        candidates = set(changed_reviewer_ids.tolist())
+        if previous_threshold is not None:
+            low, high = min(previous_threshold, self._threshold), max(previous_threshold, self._threshold)
+            candidates.update(user_id for reputation, user_id in self._reputations.irange(low, high))
+        for user_id in candidates:
+            selected = bool(self._reputation(user_id) >= self._threshold)
+            if selected == self._reviewers["selected"][user_id]: continue
+            self._reviewers["selected"][user_id] = selected
+            review_ids = self._review_ids_of(user_id)
+            if not review_ids: continue
+            content_ids = platform.reviews["content_id"][review_ids]
+            sign = 1 if selected else -1
+            np.add.at(self._content["evaluation_sum"], content_ids, sign * platform.reviews["evaluation"][review_ids])
+            np.add.at(self._content["selected_count"], content_ids, sign)
+
+    def content_quality_estimate(self, content_id):
+        if self._content["selected_count"][content_id] == 0: return None
+        return float(self._content["evaluation_sum"][content_id] / self._content["selected_count"][content_id])
+
+    def calculate_reviewer_estimates(self, platform):
+        self._ensure_reviewers(platform)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.reviewer_quality_estimates = _optional_floats(self._reviewers["score_sum"] / self._reviewers["score_count"])
+    def calculate_content_estimates(self, platform):
+        self.selected_reviewers = self._reviewers["selected"].copy()
+        self.n_selected_reviews_for_content = self._content["selected_count"].copy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            content_quality_estimates = self._content["evaluation_sum"] / self._content["selected_count"]
+        # (checking the count, as the running sum may keep a rounding residue)
+        self.content_quality_estimates = _optional_floats(content_quality_estimates, self.n_selected_reviews_for_content > 0)
+
+
+class _SortedMultiset:
+    """
+        Sorted multiset with O(log n) add/remove/indexing (order statistics): a list of sorted buckets of
+        at most 2 * load items, plus a Fenwick tree over the bucket sizes to find the bucket holding the k-th item.
+    """
+    def __init__(self, load=256):
+        self._load = load
+        self._buckets = []
+        self._maxes = []
+        self._len = 0
+        self._tree = []
+
+    def __len__(self):
+        return self._len
+
+    def _rebuild_tree(self):
+        self._tree = [len(bucket) for bucket in self._buckets]
+        for i in range(len(self._tree)):
+            parent = i | (i + 1)
+            if parent < len(self._tree): self._tree[parent] += self._tree[i]
+    def _tree_add(self, i, delta):
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i |= i + 1
+    def _locate(self, k):
+        # (bucket, position in bucket) of the k-th smallest item
+        bucket_i, step = -1, 1 << len(self._tree).bit_length()
+        while step:
+            if bucket_i + step < len(self._tree) and self._tree[bucket_i + step] <= k:
+                bucket_i += step
+                k -= self._tree[bucket_i]
+            step >>= 1
+        return bucket_i + 1, k
+
+    def add(self, item):
+        if not self._buckets:
+            self._buckets, self._maxes = [[item]], [item]
+            self._rebuild_tree()
+        else:
+            i = min(bisect.bisect_left(self._maxes, item), len(self._maxes) - 1)
+            bucket = self._buckets[i]
+            bisect.insort(bucket, item)
+            self._maxes[i] = bucket[-1]
+            if len(bucket) > 2 * self._load:
+                self._buckets[i:i + 1] = [bucket[:self._load], bucket[self._load:]]
+                self._maxes[i:i + 1] = [bucket[self._load - 1], bucket[-1]]
+                self._rebuild_tree()
             else:
-                estimated_SDs.append(10**8) # simply huge number to put it at the back of the list
-        self.content_quality_estimates_commitment_order = np.argsort(estimated_SDs)
\ No newline at end of file
+                self._tree_add(i, 1)
+        self._len += 1
+    def remove(self, item):
+        i = bisect.bisect_left(self._maxes, item)
+        bucket = self._buckets[i]
+        del bucket[bisect.bisect_left(bucket, item)]
+        self._len -= 1
+        if bucket:
+            self._maxes[i] = bucket[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._buckets[i], self._maxes[i]
+            self._rebuild_tree()
+    def __getitem__(self, k):
+        bucket_i, position = self._locate(k)
+        return self._buckets[bucket_i][position]
+    def irange(self, low, high):
+        # items (value, key) with low <= value <= high
+        i = bisect.bisect_left(self._maxes, (low,))
+        while i < len(self._buckets):
+            bucket = self._buckets[i]
+            for item in bucket[bisect.bisect_left(bucket, (low,)):]:
+                if item[0] > high: return
+                yield item
+            i += 1
+
+
+class SharedIntermediates:
+    """
+        Intermediate results that measures would otherwise each compute identically on the same platform
+        (reviewer reputations, content x reviewer matrices, reputation percentiles): computed once, on first use,
+        and kept until the platform changes (any of its tables grows). The CSR relations (e.g. the review list of
+        every content) are already cached by the platform itself.
+        Thread-safe: a measure asking for an intermediate that another thread is computing waits for it.
+        The arrays and lists handed out are shared between measures and must not be modified.
+        On out-of-core platforms (Platform.storage_path), nothing is built per review or per score: the sums over
+        reviews and scores are streamed, chunk by chunk, from the on-disk tables (see bincount), so memory stays
+        O(users + content) however many events there are.
+    """
+    def __init__(self, platform):
+        self.platform = platform
+        self.streaming = platform.storage_path is not None
+        self._version = None
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, compute):
+        with self._lock:
+            version = (len(self.platform.users), len(self.platform.content), len(self.platform.reviews), len(self.platform.scores))
+            if version != self._version:
+                self._version, self._values, self._locks = version, {}, {}
+            values = self._values
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in values: values[key] = compute()
+            return values[key]
+
+    def bincount(self, table, keys, weights=None, minlength=0):
+        """
+            np.bincount over all rows of table (e.g. platform.reviews) of keys(table, rows), weighted by
+            weights(table, rows), where rows is a slice. Out of core, rows are read STREAM_CHUNK_ROWS at a time.
+        """
+        n_rows = len(table)
+        chunk_rows = STREAM_CHUNK_ROWS if self.streaming else max(n_rows, 1)
+        counts = np.bincount(np.zeros(0, dtype=np.int64), minlength=minlength) if weights is None else np.zeros(minlength)
+        for start in range(0, n_rows, chunk_rows):
+            rows = slice(start, min(start + chunk_rows, n_rows))
+            chunk_counts = np.bincount(keys(table, rows), weights=None if weights is None else weights(table, rows), minlength=minlength)
+            counts = chunk_counts if start == 0 else counts + chunk_counts
+        return counts
+
+    def _scored_reviewers(self, scores, rows):
+        return self.platform.reviews["author_id"][scores["review_id"][rows]]
+    def reviewer_scorer_counts(self):
+        # reviewer x score-giver matrices of score counts and score sums (see Platform.reviewer_scorer_matrix).
+        # The counts are stored as floats: products with float vectors would otherwise convert them every time.
+        return self._get("reviewer_scorer_counts", lambda: self.platform.reviewer_scorer_matrix().astype(float))
+    def reviewer_scorer_score_sums(self):
+        return self._get("reviewer_scorer_score_sums", lambda: self.platform.reviewer_scorer_matrix(self.platform.scores["score"]))
+    def reviewer_score_sums(self):
+        # Sum and count of the scores given to each reviewer's reviews: row sums of the reviewer x score-giver matrices
+        return self._get("reviewer_score_sums", lambda: self.reviewer_weighted_score_sums(np.ones(len(self.platform.users))))
+    def reviewer_score_counts(self):
+        return self._get("reviewer_score_counts", lambda: self.reviewer_score_weight_sums(np.ones(len(self.platform.users))))
+    def reviewer_weighted_score_sums(self, scorer_weights):
+        # Sum over the scores given to every reviewer's reviews of their scorer's weight x score
+        if self.streaming:
+            return self.bincount(self.platform.scores, self._scored_reviewers,
+                                 lambda scores, rows: scorer_weights[scores["scorer_id"][rows]] * scores["score"][rows], len(self.platform.users))
+        return self.reviewer_scorer_score_sums() @ scorer_weights
+    def reviewer_score_weight_sums(self, scorer_weights):
+        # Sum over the scores given to every reviewer's reviews of their scorer's weight
+        if self.streaming:
+            return self.bincount(self.platform.scores, self._scored_reviewers,
+                                 lambda scores, rows: scorer_weights[scores["scorer_id"][rows]], len(self.platform.users))
+        return self.reviewer_scorer_counts() @ scorer_weights
+    def updated_reviewer_scores(self, score_sums, score_counts, first_score_id):
+        """
+            Reviewer score sums and counts from those of the scores before first_score_id (e.g. kept by a measure since
+            an earlier calculation), adding the later scores only. Unless already computed, they become this
+            platform's reviewer_score_sums and reviewer_score_counts (and so the source of the reviewer reputations).
+        """
+        def compute():
+            scores, n_users = self.platform.scores, len(self.platform.users)
+            scored_reviewers = self.platform.reviews["author_id"][scores["review_id"][first_score_id:]]
+            return (_grown(score_sums, n_users) + np.bincount(scored_reviewers, weights=scores["score"][first_score_id:], minlength=n_users),
+                    _grown(score_counts, n_users) + np.bincount(scored_reviewers, minlength=n_users))
+        # (measures updated together start from the same shared arrays, so they share the update)
+        updated = self._get(("updated_reviewer_scores", first_score_id, id(score_sums), id(score_counts)), compute)
+        return self._get("reviewer_score_sums", lambda: updated[0]), self._get("reviewer_score_counts", lambda: updated[1])
+    def reviewer_reputations(self):
+        # Mean of the scores given to each reviewer's reviews (NaN without scores)
+        def compute():
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return self.reviewer_score_sums() / self.reviewer_score_counts()
+        return self._get("reviewer_reputations", compute)
+    def reviewer_quality_estimates(self):
+        # reviewer_reputations as a list of estimates (None for no estimate)
+        return self._get("reviewer_quality_estimates", lambda: _optional_floats(self.reviewer_reputations()))
+    def _is_shared(self, optional_values):
+        return optional_values is self._values.get("reviewer_quality_estimates")
+
+    def floats(self, optional_values):
+        # _floats(optional_values), without converting them again when they are the shared reviewer estimates
+        if self._is_shared(optional_values): return self.reviewer_reputations()
+        return _floats(optional_values)
+    def reviewer_percentile(self, reviewer_quality_estimates, percentile):
+        # np.percentile of the existing estimates; cached when they are the shared reviewer estimates
+        def compute():
+            values = self.floats(reviewer_quality_estimates)
+            return np.percentile(values[~np.isnan(values)], percentile)
+        if not self._is_shared(reviewer_quality_estimates): return compute()
+        return self._get(("reviewer_percentile", percentile), compute)
+
+    def content_review_counts(self):
+        return self._get("content_review_counts", lambda: self.platform.content_reviewer_matrix().astype(float))
+    def content_evaluation_sums(self):
+        return self._get("content_evaluation_sums", lambda: self.platform.content_reviewer_matrix(self.platform.reviews["evaluation"]))
+    def content_weight_sums(self, reviewer_weights):
+        # Sum over the reviews of every content of their reviewer's weight
+        if self.streaming:
+            return self.bincount(self.platform.reviews, _review_content, lambda reviews, rows: reviewer_weights[reviews["author_id"][rows]],
+                                 len(self.platform.content))
+        return self.content_review_counts() @ reviewer_weights
+    def content_weighted_evaluation_sums(self, reviewer_weights):
+        # Sum over the reviews of every content of their reviewer's weight x evaluation
+        if self.streaming:
+            return self.bincount(self.platform.reviews, _review_content,
+                                 lambda reviews, rows: reviewer_weights[reviews["author_id"][rows]] * reviews["evaluation"][rows], len(self.platform.content))
+        return self.content_evaluation_sums() @ reviewer_weights
+
+
+def _review_content(reviews, rows):
+    # keys of SharedIntermediates.bincount: the content of the reviews
+    return reviews["content_id"][rows]
+
+def _prefix_correlations(x, y):
+    """
+        Pearson correlation of x[:k] and y[:k] for every k = 1..len(x) in one pass, from cumulative sums of
+        x, y, x^2, y^2 and xy (centered on the overall means first, to limit cancellation).
+    """
+    x, y = x - np.mean(x), y - np.mean(y)
+    n = np.arange(1, len(x) + 1)
+    sum_x, sum_y = np.cumsum(x), np.cumsum(y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = np.cumsum(x * y) - sum_x * sum_y / n
+        variance_x = np.cumsum(x * x) - sum_x ** 2 / n
+        variance_y = np.cumsum(y * y) - sum_y ** 2 / n
+        correlations = covariance / np.sqrt(variance_x * variance_y)
+    correlations[n < 2] = np.nan
+    return np.clip(correlations, -1, 1)
+
+def _largest_change(before, after):
+    # Largest absolute difference between two float arrays, ignoring entries that are NaN in either
+    changes = np.abs(after - before)
+    changes = changes[~np.isnan(changes)]
+    return float(changes.max()) if len(changes) else 0.0
+
+def _floats(optional_values):
+    # estimates are lists with None for "no estimate"; as a float array, None becomes NaN
+    return np.array(optional_values, dtype=float)
+
+def _optional_floats(values, has_value=None):
+    # values without a value (NaN by default) become None
+    if has_value is None: return [None if x != x else x for x in values.tolist()]
+    return [x if has else None for x, has in zip(values.tolist(), has_value.tolist())]
+
+def _grown(values, n):
+    # values followed by zeros (False), up to length n
+    return np.concatenate([values, np.zeros(n - len(values), dtype=values.dtype)])
@@ -1,8 +1,37 @@
 import numpy as np
+from scipy.special import log_ndtr, ndtr, ndtri_exp
 import platform_structure
 
 def bot_scores_review(review_id):
     return np.random.rand()
 
 def bot_scores_content(content_id):
-    return np.random.rand()
\ No newline at end of file
+    return np.random.rand()
+
+def truncated_normal(means, sds, low=0, high=1, rng=np.random):
+    """
+        One exact sample of N(mean, sd^2) truncated to [low, high] for every element of means/sds (broadcast together),
+        drawn by inverse-CDF in constant time regardless of how little mass the normal puts on [low, high].
+        The CDF is inverted in log space on the lower tail (intervals above the mean are mirrored), so it stays accurate
+        both for tiny SDs with the mean far outside [low, high] and for huge SDs (low-quality reviewers, bots).
+        An infinite SD gives a uniform sample on [low, high]. rng is an np.random.Generator (or the np.random module).
+    """
+    means, sds = np.broadcast_arrays(np.asarray(means, dtype=float), np.asarray(sds, dtype=float))
+    u = rng.random(means.shape)  # RANDOMCHOICE
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        a, b = (low - means) / sds, (high - means) / sds
+        mirrored = a > 0
+        a, b = np.where(mirrored, -b, a), np.where(mirrored, -a, b)
+        log_cdf_a, log_cdf_b = log_ndtr(a), log_ndtr(b)
+        # log(cdf(a) + u * (cdf(b) - cdf(a)))
+        log_cdf_sample = log_cdf_b + np.log1p((1 - u) * np.expm1(log_cdf_a - log_cdf_b))
+        z = ndtri_exp(log_cdf_sample)
+        samples = means + sds * np.where(mirrored, -z, z)
+    samples = np.where(np.isinf(sds), low + (high - low) * u, samples)
+    return np.clip(samples, low, high)
+
+def truncated_normal_acceptance(means, sds, low=0, high=1):
+    # Probability that N(mean, sd^2) falls in [low, high]: the acceptance rate of a rejection loop drawing the same
+    # samples as truncated_normal, which would need 1 / acceptance attempts per sample on average
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return ndtr((high - np.asarray(means)) / sds) - ndtr((low - np.asarray(means)) / sds)
@@ -1,8 +1,9 @@
 import numpy as np
+from instrumentation import timed
 import random_choices
 import platform_structure
 import quality_measures
-import yaml
+import snapshot
 
 SIMULATION_PARAMETERS = {
     "N_YEARS": 1,
@@ -11,56 +12,163 @@ SIMULATION_PARAMETERS = {
     "P_USER_EXITS_PER_YEAR": 0.1,
     "N_CONTENT_PER_USER_PER_YEAR": 1,
     "N_REVIEWS_PER_USER_PER_YEAR": 3,
-    "N_REVIEW_SCORES_PER_USER_PER_YEAR": 10
+    "N_REVIEW_SCORES_PER_USER_PER_YEAR": 10,
+    "CONTENT_SELECTION": "uniform",  # "uniform": reviewed content is chosen uniformly; "interest": close to the reviewer's interest_topic
+    "INTEREST_N_PROBE": 4,  # "interest": cells of Platform.content_topic_index searched for every review
+    "INTEREST_N_CANDIDATES": 32,  # "interest": the reviewer picks the closest of this many contents drawn from those cells
 }
 
-def run(SIMULATION_PARAMETERS=SIMULATION_PARAMETERS, p_bots=0, n_years=1):
-    platform = platform_structure.Platform()
+def run(SIMULATION_PARAMETERS=SIMULATION_PARAMETERS, p_bots=0, n_years=1, engine="vectorized", rng=None, timings=None,
+        PLATFORM_PARAMETERS=platform_structure.PLATFORM_PARAMETERS, platform=None, checkpoint_path=None, checkpoint_every=1, tracer=None,
+        storage_path=None, overwrite_storage=False):
+    """
+        engine="vectorized" simulates each year with a few batched array operations (Platform.users_* methods);
+        engine="loop" is the original event-by-event simulation. Both draw from the same distributions.
+        rng: np.random.Generator used for every random choice (default: seeded from the global np.random state)
+        timings: optional dict, receives the total seconds spent in each step (summed over years)
+        platform: continue this platform (e.g. from snapshot.load_platform) for n_years more years instead of starting
+            a new one; it keeps its own rng (and PARAMETERS), so continuing a loaded snapshot gives the same platform as
+            never having stopped
+        checkpoint_path: save a snapshot there every checkpoint_every years and after the last year (see resume)
+        tracer: optional instrumentation.Tracer, receives a span per step and the counters and histograms of the
+            platform events of every year (it is the platform's tracer during the run)
+        storage_path: simulate a new platform out of core, with its reviews and scores in on-disk append logs in this
+            directory (see Platform); logs already there are only overwritten with overwrite_storage=True
+    """
+    SIMULATION_PARAMETERS = _with_default_parameters(SIMULATION_PARAMETERS)
+    if tracer is not None: timings = tracer.timings("simulation", timings)
+    new_platform = platform is None
+    if new_platform:
+        platform = platform_structure.Platform(PARAMETERS=PLATFORM_PARAMETERS, rng=rng, storage_path=storage_path, overwrite_storage=overwrite_storage)
+    simulate_year = {"vectorized": _simulate_year_vectorized, "loop": _simulate_year_loop}[engine]
+    run_parameters = {"SIMULATION_PARAMETERS": SIMULATION_PARAMETERS, "p_bots": p_bots, "engine": engine}
 
-    def add_users_to_platform(n_users_to_add=0):
-        n_bots_to_add = int(n_users_to_add * p_bots)
+    previous_tracer, platform.tracer = platform.tracer, tracer
+    try:
+        if new_platform:
+            with timed(timings, "initial users"):
+                _add_users_to_platform(platform, SIMULATION_PARAMETERS["N_USERS_START"], p_bots, engine)
+        starting_year = platform.SIMULATED_YEARS
+        for year in range(starting_year, starting_year + n_years):
+            platform.CURRENT_YEAR = year
+            if tracer is not None: tracer.begin_year(year)
+            simulate_year(platform, SIMULATION_PARAMETERS, timings)
+
+            # step 5: new users join
+            with timed(timings, "step 5: new users"):
+                _add_users_to_platform(platform, SIMULATION_PARAMETERS["N_NEW_USERS_PER_YEAR"], p_bots, engine)
+            platform.SIMULATED_YEARS = year + 1
+
+            if checkpoint_path is not None and ((year + 1 - starting_year) % checkpoint_every == 0 or year == starting_year + n_years - 1):
+                with timed(timings, "checkpoint"):
+                    snapshot.save_snapshot(checkpoint_path, platform, run_parameters=run_parameters)
+            if tracer is not None:
+                tracer.count("active users", len(platform.active_users))
+                tracer.end_year()
+    finally:
+        platform.tracer = previous_tracer
+        if tracer is not None: tracer.end_year()  # (the year an exception interrupted)
+    return platform
+
+def resume(checkpoint_path, n_years, checkpoint_every=1, timings=None, mmap=True, tracer=None, overwrite_storage=False):
+    """
+        Continues the simulation saved at checkpoint_path by run(checkpoint_path=...) for n_years more years,
+        with the same parameters, and keeps checkpointing there. overwrite_storage: see snapshot.load_platform
+    """
+    platform = snapshot.load_platform(checkpoint_path, mmap=mmap, overwrite_storage=overwrite_storage)
+    run_parameters = snapshot.load_run_parameters(checkpoint_path)
+    return run(n_years=n_years, timings=timings, platform=platform, checkpoint_path=checkpoint_path,
+               checkpoint_every=checkpoint_every, tracer=tracer, **run_parameters)
+
+def _with_default_parameters(parameters):
+    # Caller dicts may lack the keys added since they were written (e.g. Tests.ipynb's): those keep their default
+    return dict(SIMULATION_PARAMETERS, **parameters)
+
+def _add_users_to_platform(platform, n_users_to_add, p_bots, engine):
+    n_bots_to_add = int(n_users_to_add * p_bots)
+    if engine == "loop":
         for i in range(n_bots_to_add): platform.add_bot_user()
         for i in range(n_bots_to_add, n_users_to_add): platform.add_genuine_user()
-    def make_user_exits(ACTIVE_USERS, p_exit=SIMULATION_PARAMETERS["P_USER_EXITS_PER_YEAR"]):
-        n_users_to_exit = int(len(ACTIVE_USERS) * p_exit)
-        users_to_exit = np.random.choice(ACTIVE_USERS, n_users_to_exit, replace=False)
-        for user in users_to_exit:
-            user.active = False
-
-    starting_year = 0
-    add_users_to_platform(SIMULATION_PARAMETERS["N_USERS_START"])
-    for year in range(starting_year, starting_year + n_years):
-        platform.CURRENT_YEAR = year
-        ACTIVE_USERS = [user for user in platform.USERS if user.active]
-        np.random.shuffle(ACTIVE_USERS)
-
-        # step 1: current users publish content
+    else:
+        platform.add_bot_users(n_bots_to_add)
+        platform.add_genuine_users(n_users_to_add - n_bots_to_add)
+
+def _choose_content_to_review(platform, user_ids, n_reviews_per_user, SIMULATION_PARAMETERS):
+    # Content reviewed by np.repeat(user_ids, n_reviews_per_user) (see "CONTENT_SELECTION")
+    if SIMULATION_PARAMETERS["CONTENT_SELECTION"] == "interest":
+        return platform.content_topic_index().sample_nearby(
+            platform.content["topic"], platform.users["interest_topic"][user_ids], platform.rng, SIMULATION_PARAMETERS["INTEREST_N_PROBE"],
+            SIMULATION_PARAMETERS["INTEREST_N_CANDIDATES"], n_samples=n_reviews_per_user).ravel()
+    return platform.rng.integers(len(platform.content), size=len(user_ids) * n_reviews_per_user)
+
+def _simulate_year_loop(platform, SIMULATION_PARAMETERS, timings=None):
+    def make_user_exits(p_exit=SIMULATION_PARAMETERS["P_USER_EXITS_PER_YEAR"]):
+        n_users_to_exit = int(len(platform.active_users) * p_exit)
+        users_to_exit = platform.active_users.sample(platform.rng, n_users_to_exit, replace=False)
+        for user_id in users_to_exit:
+            platform.USERS[user_id].active = False
+
+    ACTIVE_USERS = [platform.USERS[user_id] for user_id in platform.active_users.ids]
+    platform.rng.shuffle(ACTIVE_USERS)
+
+    # step 1: current users publish content
+    with timed(timings, "step 1: publish content"):
         for user in ACTIVE_USERS:
             for i in range(SIMULATION_PARAMETERS["N_CONTENT_PER_USER_PER_YEAR"]):
                 platform.user_publish_content(user)
 
-        # step 2: current users review content
+    # step 2: current users review content
+    with timed(timings, "step 2: review content"):
         for user in ACTIVE_USERS:
             for i in range(SIMULATION_PARAMETERS["N_REVIEWS_PER_USER_PER_YEAR"]):
-                content = np.random.choice(platform.CONTENT)
+                content = platform.CONTENT[_choose_content_to_review(platform, [user.id], 1, SIMULATION_PARAMETERS)[0]]
                 platform.user_review_content(user, content)
 
-        # step 3: current users score reviews
+    # step 3: current users score reviews
+    with timed(timings, "step 3: score reviews"):
         for user in ACTIVE_USERS:
             for i in range(SIMULATION_PARAMETERS["N_REVIEW_SCORES_PER_USER_PER_YEAR"]):
-                review = None
-                while review is None:
-                    content = np.random.choice(platform.CONTENT)
-                    if len(content.review_ids) == 0: continue
-                    review = platform.REVIEWS[np.random.choice(content.review_ids)]
+                if len(platform.reviewed_content) == 0:
+                    if platform.tracer is not None: platform.tracer.count("scores skipped (no reviewed content)", SIMULATION_PARAMETERS["N_REVIEW_SCORES_PER_USER_PER_YEAR"] - i)
+                    break
+                content = platform.CONTENT[platform.reviewed_content.sample(platform.rng)]
+                review = platform.REVIEWS[platform.rng.choice(content.review_ids)]
                 platform.user_score_review(user, review)
 
-        # step 4: some users leave the platform
-        make_user_exits(ACTIVE_USERS)
+    # step 4: some users leave the platform
+    with timed(timings, "step 4: user exits"):
+        make_user_exits()
 
-        # step 5: new users join
-        add_users_to_platform(SIMULATION_PARAMETERS["N_NEW_USERS_PER_YEAR"])
-    return platform
+def _simulate_year_vectorized(platform, SIMULATION_PARAMETERS, timings=None):
+    active_user_ids = platform.active_users.ids.copy()
+
+    # step 1: current users publish content
+    with timed(timings, "step 1: publish content"):
+        platform.users_publish_content(np.repeat(active_user_ids, SIMULATION_PARAMETERS["N_CONTENT_PER_USER_PER_YEAR"]))
+
+    # step 2: current users review content (uniformly chosen among all content, or close to their interests)
+    with timed(timings, "step 2: review content"):
+        reviewer_ids = np.repeat(active_user_ids, SIMULATION_PARAMETERS["N_REVIEWS_PER_USER_PER_YEAR"])
+        platform.users_review_content(reviewer_ids, _choose_content_to_review(platform, active_user_ids, SIMULATION_PARAMETERS["N_REVIEWS_PER_USER_PER_YEAR"],
+                                                                              SIMULATION_PARAMETERS))
+
+    # step 3: current users score reviews: content uniformly chosen among reviewed content (platform.reviewed_content),
+    #         then a review uniformly chosen among that content's reviews
+    with timed(timings, "step 3: score reviews"):
+        scorer_ids = np.repeat(active_user_ids, SIMULATION_PARAMETERS["N_REVIEW_SCORES_PER_USER_PER_YEAR"])
+        if len(platform.reviewed_content) > 0:
+            offsets, order = platform.content_reviews()
+            content_ids = platform.reviewed_content.sample(platform.rng, size=len(scorer_ids))
+            n_reviews = offsets[content_ids + 1] - offsets[content_ids]
+            review_ids = order[offsets[content_ids] + (platform.rng.random(len(scorer_ids)) * n_reviews).astype(np.int64)]
+            platform.users_score_reviews(scorer_ids, review_ids)
+        elif platform.tracer is not None:
+            platform.tracer.count("scores skipped (no reviewed content)", len(scorer_ids))
+
+    # step 4: some users leave the platform
+    with timed(timings, "step 4: user exits"):
+        n_users_to_exit = int(len(platform.active_users) * SIMULATION_PARAMETERS["P_USER_EXITS_PER_YEAR"])
+        platform.set_users_active(platform.active_users.sample(platform.rng, n_users_to_exit, replace=False), False)
 
 if __name__=="__main__":
     platform = run()
@@ -71,5 +179,4 @@ if __name__=="__main__":
         measure.calculate_estimates(platform)
         print(measure.evaluate_performance(platform))
 
-    with open('dump.yml', 'w') as f:
-        f.write(yaml.dump([platform, measures]))
+    snapshot.save_snapshot('dump', platform, measures)
@@ -0,0 +1,217 @@
+"""
+    Binary snapshot of a platform (and optionally of quality measures' estimates) as a directory of .npy files,
+    path/generation-<n>, with path/CURRENT naming the directory of the current snapshot:
+        metadata.json                           CURRENT_YEAR, SIMULATED_YEARS, year_starts, PARAMETERS, RNG state, measure
+                                                names, classes and constructor parameters,
+                                                parameters of the simulation.run that saved it (checkpoints),
+                                                storage_path and row counts of the reviews and scores logs (out of core)
+        <table>.<column>.npy                    entity columns (users, content; reviews and scores unless out of core)
+        <relation>.offsets.npy, .order.npy      CSR relations (content_reviews, user_reviews, user_content, review_scores;
+                                                out-of-core platforms only save those already built)
+        <index>.ids.npy                         sampling indexes (active_users, reviewed_content), in their packed order
+        content_topic_index.*.npy               centroids and item cells of Platform.content_topic_index (if built; the
+                                                number of content it was trained on is in metadata.json)
+        measure<i>.<estimates>.npy              reviewer/content estimates as float arrays (NaN for None) and commitment order
+                                                (the measures saved, then the measures they depend on)
+    Every array is a plain .npy file, so load_platform can memory-map them and a multi-GB platform opens instantly;
+    pages are only read when used.
+    The reviews and scores of an out-of-core platform (Platform.storage_path) are not copied: the snapshot points at
+    their on-disk logs and records how many rows they had, and load_platform reopens the logs (as DiskColumnTables)
+    with those rows, so the loaded platform stays out of core. The logs only ever grow, so a snapshot stays valid while
+    its platform goes on; the platform loaded from it appends to the same logs, after the snapshot's rows. A platform
+    holds the lock of its storage_path (so only one at a time appends to the logs), and loading a snapshot whose rows
+    a later snapshot goes beyond raises instead of overwriting them (see columnar_store.DiskColumnTable).
+    Saving again at path writes a new generation and then points CURRENT at it (os.replace, atomic), so an interrupted
+    save (e.g. a crash while checkpointing) leaves the previous snapshot current. Snapshot files are never renamed or
+    overwritten, only deleted once no longer current, which may fail while they are still memory-mapped (e.g. by the
+    platform resumed from them, on Windows): such generations are left behind and deleted by a later save.
+"""
+import importlib
+import inspect
+import json
+import os
+import shutil
+import numpy as np
+import measure_engine
+import platform_structure
+import quality_measures
+import topic_index
+from columnar_store import ColumnTable, IdSet
+
+FORMAT_VERSION = 7
+GENERATION_PREFIX = "generation-"
+TABLES = ("users", "content", "reviews", "scores")
+RELATIONS = ("content_reviews", "user_reviews", "user_content", "review_scores")
+EVENT_TABLES = ("reviews", "scores")  # on-disk logs out of core
+INDEXES = ("active_users", "reviewed_content")
+
+
+def save_snapshot(path, platform, measures=(), run_parameters=None):
+    """
+        measures are saved with the measures they depend on (e.g. the estimating_measure of BayesWeightingMeasureEstimate)
+        run_parameters: JSON-serializable dict stored with the snapshot (see load_run_parameters)
+    """
+    os.makedirs(path, exist_ok=True)
+    generations = _generations(path)
+    generation = f"{GENERATION_PREFIX}{max(generations.values(), default=0) + 1}"
+    _write_snapshot(os.path.join(path, generation), platform, measures, run_parameters)
+    with open(os.path.join(path, "CURRENT.saving"), "w") as f:
+        f.write(generation)
+    os.replace(os.path.join(path, "CURRENT.saving"), os.path.join(path, "CURRENT"))
+    if platform.storage_path is not None:
+        # The logs' rows so far are now referred to: they are not overwritten without asking (see DiskColumnTable)
+        for table_name in EVENT_TABLES: getattr(platform, table_name).commit()
+    # (including those left behind by interrupted saves)
+    for old_generation in generations:
+        try: shutil.rmtree(os.path.join(path, old_generation))
+        except OSError: pass
+
+def _generations(path):
+    # generation directory name -> number
+    return {name: int(name[len(GENERATION_PREFIX):]) for name in os.listdir(path) if name.startswith(GENERATION_PREFIX)}
+
+def _write_snapshot(path, platform, measures, run_parameters):
+    os.makedirs(path)
+    out_of_core = platform.storage_path is not None
+    for table_name in TABLES:
+        table = getattr(platform, table_name)
+        if out_of_core and table_name in EVENT_TABLES:
+            table.flush()  # (the snapshot only records its row count)
+            continue
+        for column_name in table.schema:
+            np.save(os.path.join(path, f"{table_name}.{column_name}.npy"), table[column_name])
+    for relation_name in RELATIONS:
+        # (out of core, the indexes over reviews and scores are not built just for the snapshot: they would hold every id in memory)
+        if out_of_core and relation_name not in platform._relations: continue
+        offsets, order = getattr(platform, relation_name)()
+        np.save(os.path.join(path, f"{relation_name}.offsets.npy"), offsets)
+        np.save(os.path.join(path, f"{relation_name}.order.npy"), order)
+    for index_name in INDEXES:
+        # saved in packed order, so that a loaded platform samples exactly like the saved one
+        np.save(os.path.join(path, f"{index_name}.ids.npy"), getattr(platform, index_name).ids)
+    if platform._content_topic_index is not None:
+        np.save(os.path.join(path, "content_topic_index.centroids.npy"), platform._content_topic_index.centroids)
+        np.save(os.path.join(path, "content_topic_index.cells.npy"), platform._content_topic_index._cells["cell"])
+    saved_ids = {id(measure) for measure in measures}
+    measures = list(measures) + [measure for measure in measure_engine.dependency_order(measures) if id(measure) not in saved_ids]
+    measure_indexes = {id(measure): measure_i for measure_i, measure in enumerate(measures)}
+    for measure_i, measure in enumerate(measures):
+        for estimates_name in ("reviewer_quality_estimates", "content_quality_estimates"):
+            np.save(os.path.join(path, f"measure{measure_i}.{estimates_name}.npy"), np.array(getattr(measure, estimates_name), dtype=float))
+        np.save(os.path.join(path, f"measure{measure_i}.content_quality_estimates_commitment_order.npy"),
+                np.asarray(measure.content_quality_estimates_commitment_order))
+    metadata = {
+        "format_version": FORMAT_VERSION,
+        "CURRENT_YEAR": platform.CURRENT_YEAR,
+        "SIMULATED_YEARS": platform.SIMULATED_YEARS,
+        "year_starts": {table_name: [int(start) for start in starts] for table_name, starts in platform.year_starts.items()},
+        "PARAMETERS": {key: value for key, value in platform.PARAMETERS.items() if not callable(value)},
+        "rng": {"bit_generator": type(platform.rng.bit_generator).__name__, "state": platform.rng.bit_generator.state},
+        "measures": [dict(_measure_metadata(measure, measure_indexes), dependency_only=id(measure) not in saved_ids) for measure in measures],
+        "run_parameters": run_parameters,
+        "content_topic_index_trained_on": platform._content_topic_index.n_trained_on if platform._content_topic_index is not None else None,
+        "storage_path": os.path.abspath(platform.storage_path) if out_of_core else None,
+        "event_rows": {table_name: len(getattr(platform, table_name)) for table_name in EVENT_TABLES} if out_of_core else None,
+    }
+    with open(os.path.join(path, "metadata.json"), "w") as f:
+        json.dump(metadata, f)
+
+def _measure_metadata(measure, measure_indexes):
+    # Name, class and constructor arguments of measure (read from its attributes of the same names); measures among
+    # them (e.g. an estimating_measure) are given by their index in the snapshot
+    parameters = {}
+    for parameter_name in inspect.signature(type(measure).__init__).parameters:
+        if parameter_name in ("self", "name") or not hasattr(measure, parameter_name): continue
+        value = getattr(measure, parameter_name)
+        parameters[parameter_name] = {"measure": measure_indexes[id(value)]} if isinstance(value, quality_measures.QualityMeasure) else value
+    return {"name": measure.name, "class": f"{type(measure).__module__}.{type(measure).__qualname__}", "parameters": parameters}
+
+def _current_generation(path):
+    with open(os.path.join(path, "CURRENT")) as f:
+        return os.path.join(path, f.read())
+
+def _load_metadata(path):
+    with open(os.path.join(path, "metadata.json")) as f:
+        metadata = json.load(f)
+    if metadata["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"unsupported snapshot format version {metadata['format_version']}")
+    return metadata
+
+def load_platform(path, mmap=True, overwrite_storage=False):
+    """
+        With mmap=True the columns are copy-on-write memory maps: nothing is read until used, changes
+        (e.g. users leaving) stay in memory and never modify the snapshot, and appending copies a table into memory.
+        An out-of-core platform gets its reviews and scores logs back, appended to in place (whatever mmap is), and
+        holds their lock; if a later snapshot refers to rows after this one's, loading raises unless overwrite_storage
+        is set (those rows are then overwritten as the loaded platform goes on).
+    """
+    path = _current_generation(path)
+    metadata = _load_metadata(path)
+    mmap_mode = "c" if mmap else None
+    rng = np.random.Generator(getattr(np.random, metadata["rng"]["bit_generator"])())
+    rng.bit_generator.state = metadata["rng"]["state"]
+    platform = platform_structure.Platform(PARAMETERS=dict(platform_structure.PLATFORM_PARAMETERS, **metadata["PARAMETERS"]), rng=rng)
+    if metadata["storage_path"] is not None:
+        platform._open_storage(metadata["storage_path"], metadata["event_rows"], overwrite=overwrite_storage)
+    for table_name in TABLES:
+        table = getattr(platform, table_name)
+        if platform.storage_path is not None and table_name in EVENT_TABLES: continue
+        columns = {column_name: np.load(os.path.join(path, f"{table_name}.{column_name}.npy"), mmap_mode=mmap_mode)
+                   for column_name in table.schema}
+        setattr(platform, table_name, ColumnTable.from_columns(table.schema, columns))
+    platform.USERS = platform_structure.EntityList(platform, platform.users, platform_structure.User)
+    platform.CONTENT = platform_structure.EntityList(platform, platform.content, platform_structure.Content)
+    platform.REVIEWS = platform_structure.EntityList(platform, platform.reviews, platform_structure.Review)
+    # Prime the CSR relation cache (see Platform._relation) so that it is not rebuilt by sorting
+    relation_sizes = {"content_reviews": (platform.reviews, platform.content), "user_reviews": (platform.reviews, platform.users),
+                      "user_content": (platform.content, platform.users), "review_scores": (platform.scores, platform.reviews)}
+    for relation_name, (table, keys_table) in relation_sizes.items():
+        if not os.path.exists(os.path.join(path, f"{relation_name}.offsets.npy")): continue
+        offsets = np.load(os.path.join(path, f"{relation_name}.offsets.npy"), mmap_mode=mmap_mode)
+        order = np.load(os.path.join(path, f"{relation_name}.order.npy"), mmap_mode=mmap_mode)
+        platform._relations[relation_name] = (len(table), len(keys_table), offsets, order)
+    for index_name in INDEXES:
+        setattr(platform, index_name, IdSet.from_ids(np.load(os.path.join(path, f"{index_name}.ids.npy"))))
+    if os.path.exists(os.path.join(path, "content_topic_index.centroids.npy")):
+        index = topic_index.IVFIndex(np.load(os.path.join(path, "content_topic_index.centroids.npy")))
+        cells = np.load(os.path.join(path, "content_topic_index.cells.npy"))
+        index._cells.extend(len(cells), cell=cells)
+        index.n_trained_on = metadata["content_topic_index_trained_on"]
+        platform._content_topic_index = index
+    platform.year_starts = metadata["year_starts"]
+    platform.CURRENT_YEAR = metadata["CURRENT_YEAR"]
+    platform.SIMULATED_YEARS = metadata["SIMULATED_YEARS"]
+    return platform
+
+def load_run_parameters(path):
+    return _load_metadata(_current_generation(path))["run_parameters"]
+
+def load_measures(path, mmap=True):
+    """
+        Returns the saved measures: instances of their classes, constructed with their saved parameters and holding
+        their estimates and commitment order, so that evaluate_performance can be called on them (and they can be
+        calculated again). The measures they depend on are restored with their estimates too.
+        What a measure keeps between calculations is not saved: update_estimates recalculates from scratch, and an
+        IncrementalQualityMeasure has to be attached to a platform again.
+    """
+    path = _current_generation(path)
+    metadata = _load_metadata(path)
+    mmap_mode = "c" if mmap else None
+    measures = [None] * len(metadata["measures"])
+    def restore(measure_i):
+        if measures[measure_i] is not None: return measures[measure_i]
+        entry = metadata["measures"][measure_i]
+        module_name, class_name = entry["class"].rsplit(".", 1)
+        measure_class = getattr(importlib.import_module(module_name), class_name)
+        parameters = {parameter_name: restore(value["measure"]) if isinstance(value, dict) and set(value) == {"measure"} else value
+                      for parameter_name, value in entry["parameters"].items()}
+        measure = measure_class(**parameters)
+        measure.name = entry["name"]
+        for estimates_name in ("reviewer_quality_estimates", "content_quality_estimates"):
+            estimates = np.load(os.path.join(path, f"measure{measure_i}.{estimates_name}.npy"), mmap_mode=mmap_mode)
+            setattr(measure, estimates_name, [None if x != x else x for x in estimates.tolist()])
+        measure.content_quality_estimates_commitment_order = np.load(
+            os.path.join(path, f"measure{measure_i}.content_quality_estimates_commitment_order.npy"), mmap_mode=mmap_mode)
+        measures[measure_i] = measure
+        return measure
+    return [restore(measure_i) for measure_i, entry in enumerate(metadata["measures"]) if not entry["dependency_only"]]
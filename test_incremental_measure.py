@@ -0,0 +1,34 @@
+"""
+    Checks that IncrementalQualityMeasure, kept up to date as the platform notifies it of new events (one event at a
+    time with the loop engine, whole batches with the vectorized one), agrees with the batch SimpleMeanThresholdedReviewers
+    calculation on the same platform.
+"""
+import numpy as np
+import pytest
+import quality_measures
+import simulation
+
+PARAMETERS = dict(simulation.SIMULATION_PARAMETERS, N_USERS_START=150, N_NEW_USERS_PER_YEAR=15)
+
+
+@pytest.mark.parametrize("engine", ["loop", "vectorized"])
+@pytest.mark.parametrize("threshold_percentile", [0, 50, 80])
+def test_incremental_measure_matches_batch(engine, threshold_percentile):
+    # Attached after the first year (replaying its events), then updated by the platform during two more years
+    platform = simulation.run(SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.2, n_years=1, engine=engine, rng=np.random.default_rng(5))
+    incremental = quality_measures.IncrementalQualityMeasure(threshold_percentile)
+    incremental.attach(platform)
+    simulation.run(SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.2, n_years=2, engine=engine, platform=platform)
+    batch = quality_measures.SimpleMeanThresholdedReviewers(threshold_percentile)
+    incremental.calculate_estimates(platform)
+    batch.calculate_estimates(platform)
+
+    # (sums accumulated in another order: equal up to rounding)
+    assert [x is None for x in incremental.reviewer_quality_estimates] == [x is None for x in batch.reviewer_quality_estimates]
+    np.testing.assert_allclose(quality_measures._floats(incremental.reviewer_quality_estimates),
+                               quality_measures._floats(batch.reviewer_quality_estimates), rtol=0, atol=1e-12)
+    assert incremental.selected_reviewers.tolist() == batch.selected_reviewers.tolist()
+    assert incremental.n_selected_reviews_for_content.tolist() == batch.n_selected_reviews_for_content.tolist()
+    assert [x is None for x in incremental.content_quality_estimates] == [x is None for x in batch.content_quality_estimates]
+    np.testing.assert_allclose(quality_measures._floats(incremental.content_quality_estimates),
+                               quality_measures._floats(batch.content_quality_estimates), rtol=0, atol=1e-12)
@@ -0,0 +1,35 @@
+"""
+    Checks what instrumentation.Tracer records for a simulation run.
+"""
+import numpy as np
+import pytest
+import instrumentation
+import quality_measures
+import simulation
+from measure_engine import MeasureEngine
+
+
+def test_tracer_years():
+    tracer = instrumentation.Tracer()
+    platform = simulation.run(n_years=2, rng=np.random.default_rng(0), tracer=tracer)
+    assert tracer.year is None
+    MeasureEngine([quality_measures.SimpleMean()]).evaluate(platform, timings=tracer.timings("measures"))
+    tracer.end_year()
+    counters = [event for event in tracer.events if event["type"] == "counters"]
+    assert [event["year"] for event in counters] == [None, 0, 1, None]
+    assert all(name.startswith("measures/") for name in counters[-1]["values"])
+    assert not any(name.startswith("measures/") for event in counters[:-1] for name in event["values"])
+
+@pytest.mark.parametrize("engine", ["loop", "vectorized"])
+def test_evaluations_and_scores_are_counted_separately(engine):
+    # Only the truncated normal draws that are kept count: bots' reviews and scores, and scores of bots' reviews, are not drawn from it
+    tracer = instrumentation.Tracer()
+    platform = simulation.run(p_bots=0.2, n_years=1, engine=engine, rng=np.random.default_rng(0), tracer=tracer)
+    values = [event for event in tracer.events if event["type"] == "counters" and event["year"] == 0][0]["values"]
+    is_bot = platform.users["is_bot"]
+    genuine_reviews = np.count_nonzero(~is_bot[platform.reviews["author_id"]])
+    genuine_scores = np.count_nonzero(~is_bot[platform.scores["scorer_id"]] & ~is_bot[platform.reviews["author_id"][platform.scores["review_id"]]])
+    assert 0 < genuine_scores < len(platform.scores)
+    assert values["truncated normal evaluations"] == genuine_reviews
+    assert values["truncated normal scores"] == genuine_scores
+    assert values["rejection attempts avoided"] >= genuine_reviews
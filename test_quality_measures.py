@@ -0,0 +1,293 @@
+"""
+    Checks the sparse-matrix quality measures (quality_measures.py) against the original loop-based implementation,
+    kept below as the reference (Loop* classes, walking the platform's User/Content/Review views one by one).
+    Estimates must agree up to rounding; commitment orders must rank the content identically, except that content with
+    equal keys (e.g. equal numbers of selected reviews) may come in any order among itself.
+    Also checks that updated estimates (update_estimates) match recalculated ones, and that measures streaming an
+    out-of-core platform's reviews and scores chunk by chunk match the in-memory matrix calculation, and how
+    ReputationPropagation iterates to its fixed point.
+"""
+import numpy as np
+import pytest
+import quality_measures
+import simulation
+from measure_engine import MeasureEngine
+
+PARAMETERS = dict(simulation.SIMULATION_PARAMETERS, N_USERS_START=200, N_NEW_USERS_PER_YEAR=20)
+
+
+class LoopQualityMeasure():
+    def __init__(self):
+        self.reviewer_quality_estimates = None
+        self.content_quality_estimates = None
+        self.content_quality_estimates_commitment_order = None
+
+    def clear_scores(self, platform):
+        self.reviewer_quality_estimates = [None] * len(platform.USERS)
+        self.content_quality_estimates = [None] * len(platform.CONTENT)
+        self.content_quality_estimates_commitment_order = np.arange(len(platform.USERS))
+
+    def calculate_reviewer_estimates(self, platform):
+        for reviewer in platform.USERS:
+            # Average all scores that other reviewers gave to this reviewer
+            scores = []
+            for review_id in reviewer.review_ids:
+                scores.extend(platform.REVIEWS[review_id].scores)
+            self.reviewer_quality_estimates[reviewer.id] = None if len(scores) == 0 else float(np.mean(scores))
+    def calculate_reviewer_weights(self, platform):
+        pass
+    def calculate_content_estimates(self, platform):
+        pass
+    def calculate_estimates(self, platform):
+        self.clear_scores(platform)
+        self.calculate_reviewer_estimates(platform)
+        self.calculate_reviewer_weights(platform)
+        self.calculate_content_estimates(platform)
+        self.calculate_content_quality_estimates_commitment_order(platform)
+
+
+class LoopSimpleMeanThresholdedReviewers(LoopQualityMeasure):
+    def __init__(self, threshold_percentile):
+        self.threshold_percentile = threshold_percentile
+        self.reviewer_weights = None
+        self.selected_reviews_for_content = None
+        super().__init__()
+    def calculate_reviewer_weights(self, platform):
+        self.reviewer_weights = [1 for user in platform.USERS]
+    def calculate_content_estimates(self, platform):
+        reviewer_reputation_threshold = np.percentile([x for x in self.reviewer_quality_estimates if x is not None], self.threshold_percentile)
+        self.selected_reviews_for_content = []
+        for content in platform.CONTENT:
+            evaluations = []
+            weights = []
+            self.selected_reviews_for_content.append([])
+            for review_id in content.review_ids:
+                review = platform.REVIEWS[review_id]
+                author_reputation_estimate = self.reviewer_quality_estimates[review.author_id]
+                if author_reputation_estimate is not None and author_reputation_estimate >= reviewer_reputation_threshold\
+                        and self.reviewer_weights[review.author_id] is not None:
+                    evaluations.append(review.evaluation)
+                    weights.append(self.reviewer_weights[review.author_id])
+                    self.selected_reviews_for_content[-1].append(review_id)
+            self.content_quality_estimates[content.id] = None if len(evaluations) == 0 else float(np.average(evaluations, weights=weights))
+    def commitment_keys(self, platform):
+        # commit scores according to # reviews (highest first)
+        return -np.array([len(x) for x in self.selected_reviews_for_content], dtype=float)
+    def calculate_content_quality_estimates_commitment_order(self, platform):
+        self.content_quality_estimates_commitment_order = np.argsort([len(x) for x in self.selected_reviews_for_content])[::-1]
+
+
+class LoopBayesWeightingOracle(LoopSimpleMeanThresholdedReviewers):
+    def calculate_reviewer_weights(self, platform):
+        self.reviewer_SD_estimates = [0.18/user.reviewer_quality for user in platform.USERS]
+        self.reviewer_weights = [1 / self.reviewer_SD_estimates[user.id] ** 2 for user in platform.USERS]
+
+    def commitment_keys(self, platform):
+        estimated_SDs = []
+        for content_i, content in enumerate(platform.CONTENT):
+            estimated_SD = 0
+            for review_id in self.selected_reviews_for_content[content_i]:
+                reviewer_weight = self.reviewer_weights[platform.REVIEWS[review_id].author_id]
+                if reviewer_weight is None: continue
+                estimated_SD += reviewer_weight
+            if estimated_SD > 0:
+                estimated_SDs.append(1/estimated_SD)
+            else:
+                estimated_SDs.append(10**8) # simply huge number to put it at the back of the list
+        return np.array(estimated_SDs)
+    def calculate_content_quality_estimates_commitment_order(self, platform):
+        self.content_quality_estimates_commitment_order = np.argsort(self.commitment_keys(platform))
+
+
+class LoopBayesWeightingMeasureEstimate(LoopBayesWeightingOracle):
+    def __init__(self, estimating_measure, estimating_measure_commitment, reviewer_percentile_bin_width, threshold_percentile=0):
+        self.estimating_measure = estimating_measure
+        self.estimating_measure_commitment = estimating_measure_commitment
+        self.reviewer_percentile_bin_width = reviewer_percentile_bin_width
+        super().__init__(threshold_percentile)
+
+    def calculate_reviewer_weights(self, platform):
+        reviewer_percentile_bins = np.arange(0, 1, self.reviewer_percentile_bin_width)
+        nn_reviewer_quality_estimates = np.array([x for x in self.reviewer_quality_estimates if x is not None])
+        user_bins = [None] * len(platform.USERS)
+        for user in platform.USERS:
+            user_quality_estimate = self.reviewer_quality_estimates[user.id]
+            if user_quality_estimate is None: continue
+            estimated_reviewer_percentile = np.mean(nn_reviewer_quality_estimates<user_quality_estimate)
+            user_bins[user.id] = int(estimated_reviewer_percentile // self.reviewer_percentile_bin_width)
+        distributions_for_bin = [[] for bin in reviewer_percentile_bins]
+        considered_content_n = int(len(self.estimating_measure.content_quality_estimates) * self.estimating_measure_commitment)
+        considered_content_ids = self.estimating_measure.content_quality_estimates_commitment_order[:considered_content_n]
+        for content_id in considered_content_ids:
+            content = platform.CONTENT[content_id]
+            for review_id in content.review_ids:
+                review = platform.REVIEWS[review_id]
+                user_bin = user_bins[review.author_id]
+                if user_bin is None: continue
+                distributions_for_bin[user_bin].append(review.evaluation - self.estimating_measure.content_quality_estimates[content_id])
+        self.sds_for_bin = [np.std(distributions_for_bin[bin_i]) for bin_i in range(len(reviewer_percentile_bins))]
+        self.n_for_bin = [len(distributions_for_bin[bin_i]) for bin_i in range(len(reviewer_percentile_bins))]
+        self.reviewer_weights = [None] * len(platform.USERS)
+        for user in platform.USERS:
+            if user_bins[user.id] is None: continue
+            self.reviewer_weights[user.id] = 1/self.sds_for_bin[user_bins[user.id]] ** 2
+        self.user_bins = user_bins
+
+
+def make_platform(seed, p_bots):
+    return simulation.run(SIMULATION_PARAMETERS=PARAMETERS, p_bots=p_bots, n_years=2, rng=np.random.default_rng(seed))
+
+def make_measures(kind, threshold_percentile):
+    # (measure, reference) pair; their estimating measures (if any) are calculated first
+    if kind == "simple mean":
+        return quality_measures.SimpleMeanThresholdedReviewers(threshold_percentile), LoopSimpleMeanThresholdedReviewers(threshold_percentile), []
+    if kind == "oracle":
+        return quality_measures.BayesWeightingOracle(threshold_percentile), LoopBayesWeightingOracle(threshold_percentile), []
+    estimating_measure, reference_estimating_measure = quality_measures.SimpleMean(), LoopSimpleMeanThresholdedReviewers(0)
+    return quality_measures.BayesWeightingMeasureEstimate(estimating_measure, 0.5, 0.2, threshold_percentile), \
+           LoopBayesWeightingMeasureEstimate(reference_estimating_measure, 0.5, 0.2, threshold_percentile), \
+           [(estimating_measure, reference_estimating_measure)]
+
+def notebook_measures():
+    # The measures of Tests.ipynb, plus ReputationPropagation
+    measures = [quality_measures.SimpleMean(), quality_measures.SimpleMeanThresholdedReviewers(50),
+                quality_measures.SimpleMeanThresholdedReviewers(80), quality_measures.BayesWeightingOracle()]
+    measures.append(quality_measures.BayesWeightingMeasureEstimate(measures[2], 0.1, 0.1))
+    measures.append(quality_measures.BayesWeightingMeasureEstimate(measures[2], 0.1, 0.1, threshold_percentile=20))
+    measures.append(quality_measures.ReputationPropagation())
+    return measures
+
+def assert_estimates_match(estimates, reference_estimates, atol=1e-12):
+    assert [x is None for x in estimates] == [x is None for x in reference_estimates]
+    np.testing.assert_allclose(quality_measures._floats(estimates), quality_measures._floats(reference_estimates), rtol=1e-9, atol=atol)
+
+def assert_same_commitment_order(order, reference_keys):
+    """
+        order sorts the content by the reference's keys (the same key sequence as the reference's own order); content
+        with equal keys may be in any order. The loop version gave content without any selected review the key 10**8,
+        which put it before the content only reviewed by bots (keys ~1e18); it now always comes last.
+    """
+    reference_keys = np.where(reference_keys == 10**8, np.inf, reference_keys)
+    assert sorted(order.tolist()) == list(range(len(reference_keys)))
+    np.testing.assert_allclose(reference_keys[order], np.sort(reference_keys), rtol=1e-9)
+
+def bayes_commitment_keys(measure, platform):
+    # The estimated SDs BayesWeightingOracle orders the content by: 1 / the sum of the weights of its selected reviews
+    authors = platform.reviews["author_id"]
+    weight_sums = np.bincount(platform.reviews["content_id"], np.where(measure.selected_reviewers[authors], measure.reviewer_weights[authors], 0),
+                              minlength=len(platform.content))
+    with np.errstate(divide="ignore"):
+        return np.where(weight_sums > 0, 1 / weight_sums, np.inf)
+
+
+@pytest.mark.parametrize("p_bots", [0, 0.2])
+@pytest.mark.parametrize("threshold_percentile", [0, 50])
+@pytest.mark.parametrize("kind", ["simple mean", "oracle", "measure estimate"])
+def test_measures_match_loop_implementation(kind, threshold_percentile, p_bots):
+    platform = make_platform(seed=17, p_bots=p_bots)
+    measure, reference, estimating_measures = make_measures(kind, threshold_percentile)
+    for estimating_measure, reference_estimating_measure in estimating_measures:
+        estimating_measure.calculate_estimates(platform)
+        reference_estimating_measure.calculate_estimates(platform)
+    measure.calculate_estimates(platform)
+    reference.calculate_estimates(platform)
+
+    assert_estimates_match(measure.reviewer_quality_estimates, reference.reviewer_quality_estimates)
+    assert_estimates_match(measure.content_quality_estimates, reference.content_quality_estimates)
+    assert measure.n_selected_reviews_for_content.tolist() == [len(x) for x in reference.selected_reviews_for_content]
+    if kind == "measure estimate":
+        np.testing.assert_allclose(measure.sds_for_bin, reference.sds_for_bin, rtol=1e-9)
+        assert measure.n_for_bin == reference.n_for_bin
+    assert_same_commitment_order(measure.content_quality_estimates_commitment_order, reference.commitment_keys(platform))
+
+def test_simple_mean_commitment_order_is_unchanged():
+    # Counts are integers: the sparse version sorts exactly the same array as the loop version
+    platform = make_platform(seed=3, p_bots=0.2)
+    measure, reference = quality_measures.SimpleMean(), LoopSimpleMeanThresholdedReviewers(0)
+    measure.calculate_estimates(platform)
+    reference.calculate_estimates(platform)
+    assert measure.content_quality_estimates_commitment_order.tolist() == reference.content_quality_estimates_commitment_order.tolist()
+
+@pytest.mark.parametrize("since_year", [None, 1, 2, 3])
+def test_update_estimates_matches_recalculation(since_year):
+    # Only the default since_year (the year the estimates were calculated up to, here 2) updates incrementally;
+    # any other year must still give the estimates of a full recalculation
+    platform = make_platform(seed=5, p_bots=0.1)
+    measure = quality_measures.SimpleMeanThresholdedReviewers(50)
+    measure.calculate_estimates(platform)
+    simulation.run(SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.1, n_years=2, platform=platform)
+    measure.update_estimates(platform, since_year=since_year)
+    recalculated = quality_measures.SimpleMeanThresholdedReviewers(50)
+    recalculated.calculate_estimates(platform)
+    assert_estimates_match(measure.content_quality_estimates, recalculated.content_quality_estimates)
+    assert measure.n_selected_reviews_for_content.tolist() == recalculated.n_selected_reviews_for_content.tolist()
+
+@pytest.mark.parametrize("since_year", [None, 1, 2])
+def test_update_estimates_of_every_measure_matches_recalculation(since_year):
+    platform = make_platform(seed=6, p_bots=0.2)
+    measures = notebook_measures()
+    MeasureEngine(measures).calculate_estimates(platform)
+    simulation.run(SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.2, n_years=2, platform=platform)
+    MeasureEngine(measures).update_estimates(platform, since_year=since_year)
+    recalculated = notebook_measures()
+    MeasureEngine(recalculated).calculate_estimates(platform)
+    for measure, recalculated_measure in zip(measures, recalculated):
+        # (ReputationPropagation starts from the previous fixed point: the same one, up to its tolerance)
+        atol = 10 * measure.tolerance if isinstance(measure, quality_measures.ReputationPropagation) else 1e-12
+        assert_estimates_match(measure.reviewer_quality_estimates, recalculated_measure.reviewer_quality_estimates, atol)
+        assert_estimates_match(measure.content_quality_estimates, recalculated_measure.content_quality_estimates, atol)
+        assert measure.n_selected_reviews_for_content.tolist() == recalculated_measure.n_selected_reviews_for_content.tolist()
+
+def test_streamed_estimates_match_in_memory_estimates(tmp_path, monkeypatch):
+    monkeypatch.setattr(quality_measures, "STREAM_CHUNK_ROWS", 1000)  # (several chunks)
+    in_memory = make_platform(seed=8, p_bots=0.2)
+    out_of_core = simulation.run(SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.2, n_years=2, rng=np.random.default_rng(8), storage_path=str(tmp_path))
+    assert len(out_of_core.scores) > 2 * quality_measures.STREAM_CHUNK_ROWS
+    in_memory_measures, streamed_measures = notebook_measures(), notebook_measures()
+    MeasureEngine(in_memory_measures).calculate_estimates(in_memory)
+    MeasureEngine(streamed_measures).calculate_estimates(out_of_core)
+    for measure, streamed_measure in zip(in_memory_measures, streamed_measures):
+        # (the same sums, accumulated chunk by chunk instead of through sparse matrices: equal up to rounding)
+        assert_estimates_match(streamed_measure.reviewer_quality_estimates, measure.reviewer_quality_estimates)
+        assert_estimates_match(streamed_measure.content_quality_estimates, measure.content_quality_estimates)
+        assert streamed_measure.n_selected_reviews_for_content.tolist() == measure.n_selected_reviews_for_content.tolist()
+        if isinstance(measure, quality_measures.BayesWeightingOracle):
+            # (keys that tie in memory may differ by rounding when streamed: compare them instead of the order)
+            assert_same_commitment_order(streamed_measure.content_quality_estimates_commitment_order, bayes_commitment_keys(measure, in_memory))
+        else:
+            assert streamed_measure.content_quality_estimates_commitment_order.tolist() == measure.content_quality_estimates_commitment_order.tolist()
+
+@pytest.mark.parametrize("p_bots", [0, 0.2])
+def test_reputation_propagation_converges(p_bots):
+    platform = make_platform(seed=9, p_bots=p_bots)
+    measure = quality_measures.ReputationPropagation()
+    measure.calculate_estimates(platform)
+    assert measure.converged and 1 < measure.n_iterations < measure.max_iterations
+    assert len(measure.residuals) == measure.n_iterations and measure.residuals[-1] <= measure.tolerance
+    if p_bots == 0:
+        assert np.all(np.diff(measure.residuals) < 0)
+    # (with bots, the estimates of content only bots reviewed jump as the bots' reputations fall below MIN_WEIGHTED_REPUTATION)
+    # A fixed point: iterating from it hardly moves
+    again = quality_measures.ReputationPropagation()
+    again._reputations, again._reputations_platform = measure._reputations, measure._reputations_platform
+    again.calculate_estimates(platform)
+    assert again.n_iterations == 2 and again.residuals[-1] <= measure.tolerance
+
+def test_reputation_propagation_warm_start_reaches_the_same_fixed_point():
+    platform = make_platform(seed=10, p_bots=0.2)
+    warm = quality_measures.ReputationPropagation()
+    warm.calculate_estimates(platform)
+    simulation.run(SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.2, n_years=1, platform=platform)
+    warm.calculate_estimates(platform)
+    cold = quality_measures.ReputationPropagation(warm_start=False)
+    cold.calculate_estimates(platform)
+    assert warm.converged and cold.converged and warm.n_iterations <= cold.n_iterations
+    assert_estimates_match(warm.reviewer_quality_estimates, cold.reviewer_quality_estimates, atol=10 * cold.tolerance)
+    assert_estimates_match(warm.content_quality_estimates, cold.content_quality_estimates, atol=10 * cold.tolerance)
+
+def test_reputation_propagation_stops_at_max_iterations():
+    platform = make_platform(seed=9, p_bots=0.2)
+    measure = quality_measures.ReputationPropagation(tolerance=0, max_iterations=3)
+    measure.calculate_estimates(platform)
+    assert measure.n_iterations == 3 and not measure.converged and len(measure.residuals) == 3
+    assert measure.reviewer_quality_estimates is not None and len(measure.content_quality_estimates) == len(platform.content)
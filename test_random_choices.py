@@ -0,0 +1,31 @@
+"""
+    Checks the samplers of random_choices.py.
+"""
+import numpy as np
+import pytest
+import scipy.stats
+from random_choices import truncated_normal
+
+
+def rejection_samples(rng, mean, sd, n_samples):
+    # The former sampler: draw N(mean, sd^2) until the draw is in [0, 1]
+    samples = np.empty(0)
+    while len(samples) < n_samples:
+        draws = mean + sd * rng.standard_normal(4 * n_samples)
+        samples = np.concatenate([samples, draws[(draws >= 0) & (draws <= 1)]])
+    return samples[:n_samples]
+
+@pytest.mark.parametrize("mean, sd", [(0.5, 0.18), (0.9, 0.1), (0.05, 0.6), (0.3, 3), (0.5, 18)])
+def test_truncated_normal_matches_rejection_sampling(mean, sd):
+    rng = np.random.default_rng(0)
+    samples = truncated_normal(np.full(20_000, mean), sd, 0, 1, rng=rng)
+    assert scipy.stats.ks_2samp(samples, rejection_samples(rng, mean, sd, 20_000)).pvalue > 1e-3
+
+@pytest.mark.parametrize("mean, sd", [(3, 0.1), (-2, 0.05), (0.5, 1.8e9), (0.5, np.inf)])
+def test_truncated_normal_extreme_parameters(mean, sd):
+    # Where rejection sampling would (practically) never accept, compare with the exact truncated normal CDF
+    samples = truncated_normal(np.full(20_000, mean), sd, 0, 1, rng=np.random.default_rng(1))
+    assert np.all((samples >= 0) & (samples <= 1))
+    if np.isinf(sd): cdf = scipy.stats.uniform().cdf
+    else: cdf = scipy.stats.truncnorm((0 - mean) / sd, (1 - mean) / sd, loc=mean, scale=sd).cdf
+    assert scipy.stats.kstest(samples, cdf).pvalue > 1e-3
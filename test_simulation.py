@@ -0,0 +1,71 @@
+"""
+    Checks simulation.run: caller-provided parameters, the loop and vectorized engines drawing from the same distributions,
+    and the content topic index of interest-driven content selection.
+"""
+import numpy as np
+import pytest
+import scipy.stats
+import platform_structure
+import simulation
+
+# The parameter dicts of Tests.ipynb, written before CONTENT_SELECTION / TOPIC_DISTRIBUTION / TOPIC_INDEX_N_CELLS existed
+NOTEBOOK_SIMULATION_PARAMETERS = {
+    "N_YEARS": 1,
+    "N_USERS_START": 100,
+    "N_NEW_USERS_PER_YEAR": 10,
+    "P_USER_EXITS_PER_YEAR": 0.1,
+    "N_CONTENT_PER_USER_PER_YEAR": 1,
+    "N_REVIEWS_PER_USER_PER_YEAR": 3,
+    "N_REVIEW_SCORES_PER_USER_PER_YEAR": 10,
+}
+NOTEBOOK_PLATFORM_PARAMETERS = {
+    "TOPIC_DIMENSIONALITY": 1,
+    "CONSTRAIN_SCORES_TO_01": True,
+    "BOT_TRUE_REVIEWER_QUALITY": 1e-10,
+    "BOT_TRUE_AUTHOR_QUALITY": 1e-10,
+}
+
+
+@pytest.mark.parametrize("engine", ["loop", "vectorized"])
+def test_run_with_parameters_lacking_newer_keys(engine):
+    platform = simulation.run(SIMULATION_PARAMETERS=NOTEBOOK_SIMULATION_PARAMETERS, PLATFORM_PARAMETERS=NOTEBOOK_PLATFORM_PARAMETERS,
+                              p_bots=0.1, n_years=2, engine=engine, rng=np.random.default_rng(0))
+    assert len(platform.reviews) > 0
+    assert platform.PARAMETERS["TOPIC_DISTRIBUTION"] == platform_structure.PLATFORM_PARAMETERS["TOPIC_DISTRIBUTION"]
+    assert platform.content_topic_index() is not None
+
+def test_content_topic_index_is_retrained_as_content_grows():
+    parameters = dict(simulation.SIMULATION_PARAMETERS, N_USERS_START=100, N_NEW_USERS_PER_YEAR=100, P_USER_EXITS_PER_YEAR=0,
+                      CONTENT_SELECTION="interest")
+    platform_parameters = {"TOPIC_DIMENSIONALITY": 16, "TOPIC_DISTRIBUTION": "sphere"}
+    platform = simulation.run(SIMULATION_PARAMETERS=parameters, PLATFORM_PARAMETERS=platform_parameters, n_years=1, rng=np.random.default_rng(0))
+    index = platform.content_topic_index()
+    assert index.n_trained_on == 100 and len(index.centroids) == 10
+    # 100 content in the first year, then 200, 300 and 400 more: trained again on the 600 of the third year
+    simulation.run(SIMULATION_PARAMETERS=parameters, n_years=3, platform=platform)
+    index = platform.content_topic_index()
+    assert index.n_trained_on == 600 and len(index.centroids) == int(np.sqrt(600))
+    assert len(index) == len(platform.content)
+    assert np.array_equal(index._cells["cell"], index.nearest_cells(platform.content["topic"], 1)[:, 0])
+    # never retrained with TOPIC_INDEX_RETRAIN_GROWTH=None
+    platform = simulation.run(SIMULATION_PARAMETERS=parameters, PLATFORM_PARAMETERS=dict(platform_parameters, TOPIC_INDEX_RETRAIN_GROWTH=None),
+                              n_years=4, rng=np.random.default_rng(0))
+    assert platform.content_topic_index().n_trained_on == 100
+
+def test_engines_give_the_same_distributions():
+    # Counts only depend on the parameters; evaluations and scores, pooled over a few seeded runs, must look
+    # like draws from the same distribution (two-sample KS test, plus means and SDs within a tolerance)
+    parameters = dict(simulation.SIMULATION_PARAMETERS, N_USERS_START=300)
+    platforms = {engine: [simulation.run(SIMULATION_PARAMETERS=parameters, p_bots=0.1, n_years=3, engine=engine, rng=np.random.default_rng(seed))
+                          for seed in range(4)]
+                 for engine in ("loop", "vectorized")}
+    for loop_platform, vectorized_platform in zip(platforms["loop"], platforms["vectorized"]):
+        for table_name in ("users", "content", "reviews", "scores"):
+            assert len(getattr(loop_platform, table_name)) == len(getattr(vectorized_platform, table_name))
+        assert len(loop_platform.active_users) == len(vectorized_platform.active_users)
+    for table_name, column_name in (("reviews", "evaluation"), ("scores", "score")):
+        loop_values, vectorized_values = [np.concatenate([getattr(platform, table_name)[column_name] for platform in platforms[engine]])
+                                          for engine in ("loop", "vectorized")]
+        assert scipy.stats.ks_2samp(loop_values, vectorized_values).pvalue > 1e-3
+        assert abs(loop_values.mean() - vectorized_values.mean()) < 0.02
+        assert abs(loop_values.std() - vectorized_values.std()) < 0.02
@@ -0,0 +1,146 @@
+"""
+    Checks snapshot.py: saving and reloading platforms and measures, and surviving crashes while saving.
+"""
+import os
+import numpy as np
+import pytest
+import quality_measures
+import simulation
+import snapshot
+from columnar_store import DiskColumnTable
+
+PARAMETERS = dict(simulation.SIMULATION_PARAMETERS, N_USERS_START=100)
+
+
+def test_crash_while_saving_keeps_the_previous_snapshot(tmp_path, monkeypatch):
+    path = str(tmp_path / "checkpoint")
+    platform = simulation.run(SIMULATION_PARAMETERS=PARAMETERS, n_years=1, rng=np.random.default_rng(0))
+    snapshot.save_snapshot(path, platform)
+    n_users = len(platform.users)
+    simulation.run(SIMULATION_PARAMETERS=PARAMETERS, n_years=1, platform=platform)
+    write_snapshot = snapshot._write_snapshot
+    def crash(path, *arguments):
+        os.makedirs(path)  # (a partly written snapshot)
+        raise RuntimeError("crash while writing")
+    monkeypatch.setattr(snapshot, "_write_snapshot", crash)
+    with pytest.raises(RuntimeError):
+        snapshot.save_snapshot(path, platform)
+    assert len(snapshot.load_platform(path).users) == n_users
+    # The next save replaces both
+    monkeypatch.setattr(snapshot, "_write_snapshot", write_snapshot)
+    snapshot.save_snapshot(path, platform)
+    assert len(snapshot.load_platform(path).users) == len(platform.users)
+    assert len(snapshot._generations(path)) == 1
+
+def test_saving_over_a_memory_mapped_snapshot(tmp_path, monkeypatch):
+    # Resuming maps the snapshot it then saves over. Where mapped files cannot be deleted (Windows), the save must
+    # still succeed, and leave the old files for a later save to delete.
+    path = str(tmp_path / "checkpoint")
+    platform = simulation.run(SIMULATION_PARAMETERS=PARAMETERS, n_years=1, rng=np.random.default_rng(0))
+    snapshot.save_snapshot(path, platform)
+    loaded = snapshot.load_platform(path)
+    reviewer_quality = np.array(loaded.users["reviewer_quality"])
+    def locked(path, *arguments, **keywords): raise PermissionError(f"{path} is in use")
+    with monkeypatch.context() as patch:
+        patch.setattr(snapshot.shutil, "rmtree", locked)
+        simulation.run(SIMULATION_PARAMETERS=PARAMETERS, n_years=1, platform=loaded, checkpoint_path=path)
+    assert len(snapshot._generations(path)) == 2
+    assert np.array_equal(loaded.users["reviewer_quality"][:len(reviewer_quality)], reviewer_quality)
+    assert len(snapshot.load_platform(path).users) == len(loaded.users)
+    snapshot.save_snapshot(path, loaded)
+    assert len(snapshot._generations(path)) == 1
+
+def test_resume_matches_uninterrupted_run(tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint")
+    simulation.run(SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.1, n_years=2, rng=np.random.default_rng(3), checkpoint_path=checkpoint_path)
+    platform = simulation.resume(checkpoint_path, 2)
+    uninterrupted = simulation.run(SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.1, n_years=4, rng=np.random.default_rng(3))
+    for table_name in snapshot.TABLES:
+        for column_name in getattr(uninterrupted, table_name).schema:
+            assert np.array_equal(getattr(platform, table_name)[column_name], getattr(uninterrupted, table_name)[column_name])
+    for index_name in snapshot.INDEXES:
+        assert np.array_equal(getattr(platform, index_name).ids, getattr(uninterrupted, index_name).ids)
+    assert platform.year_starts == uninterrupted.year_starts and platform.SIMULATED_YEARS == uninterrupted.SIMULATED_YEARS == 4
+    assert platform.rng.bit_generator.state == uninterrupted.rng.bit_generator.state
+
+def test_resume_out_of_core(tmp_path):
+    # The checkpoints point at the reviews and scores logs instead of copying them; resuming reopens them
+    checkpoint_path, storage_path = str(tmp_path / "checkpoint"), str(tmp_path / "logs")
+    simulation.run(SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.1, n_years=2, rng=np.random.default_rng(4),
+                   checkpoint_path=checkpoint_path, storage_path=storage_path)
+    assert not any(name.startswith(("reviews.", "scores.")) for name in os.listdir(snapshot._current_generation(checkpoint_path)))
+    platform = simulation.resume(checkpoint_path, 2)
+    assert platform.storage_path == os.path.abspath(storage_path)
+    assert isinstance(platform.scores, DiskColumnTable) and isinstance(platform.scores["score"], np.memmap)
+    uninterrupted = simulation.run(SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.1, n_years=4, rng=np.random.default_rng(4))
+    for table_name in ("reviews", "scores"):
+        for column_name in getattr(uninterrupted, table_name).schema:
+            assert np.array_equal(getattr(platform, table_name)[column_name], getattr(uninterrupted, table_name)[column_name])
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "snapshot")
+    parameters = dict(PARAMETERS, CONTENT_SELECTION="interest")
+    platform = simulation.run(SIMULATION_PARAMETERS=parameters, p_bots=0.1, n_years=2, rng=np.random.default_rng(2),
+                              PLATFORM_PARAMETERS={"TOPIC_DIMENSIONALITY": 8, "TOPIC_DISTRIBUTION": "sphere"})
+    simple_mean = quality_measures.SimpleMean()  # (saved as a dependency only)
+    measures = [quality_measures.SimpleMeanThresholdedReviewers(80), quality_measures.BayesWeightingOracle(50),
+                quality_measures.BayesWeightingMeasureEstimate(simple_mean, 0.5, 0.2, threshold_percentile=20),
+                quality_measures.ReputationPropagation(score_weight_power=2, tolerance=1e-9)]
+    for measure in [simple_mean] + measures: measure.calculate_estimates(platform)
+    snapshot.save_snapshot(path, platform, measures)
+
+    loaded = snapshot.load_platform(path)
+    for table_name in snapshot.TABLES:
+        for column_name in getattr(platform, table_name).schema:
+            assert np.array_equal(getattr(loaded, table_name)[column_name], getattr(platform, table_name)[column_name])
+    for relation_name in snapshot.RELATIONS:
+        for loaded_array, array in zip(getattr(loaded, relation_name)(), getattr(platform, relation_name)()):
+            assert np.array_equal(loaded_array, array)
+    for index_name in snapshot.INDEXES:
+        assert np.array_equal(getattr(loaded, index_name).ids, getattr(platform, index_name).ids)
+    loaded_index, index = loaded.content_topic_index(), platform.content_topic_index()
+    assert np.array_equal(loaded_index.centroids, index.centroids)
+    for loaded_array, array in zip(loaded_index.lists(), index.lists()):
+        assert np.array_equal(loaded_array, array)
+    assert loaded.year_starts == platform.year_starts and loaded.CURRENT_YEAR == platform.CURRENT_YEAR
+    assert loaded.SIMULATED_YEARS == platform.SIMULATED_YEARS and loaded.PARAMETERS == platform.PARAMETERS
+    assert loaded.rng.bit_generator.state == platform.rng.bit_generator.state
+
+    loaded_measures = snapshot.load_measures(path)
+    assert [type(measure) for measure in loaded_measures] == [type(measure) for measure in measures]
+    assert [measure.name for measure in loaded_measures] == [measure.name for measure in measures]
+    assert isinstance(loaded_measures[2].estimating_measure, quality_measures.SimpleMean)
+    assert (loaded_measures[2].estimating_measure_commitment, loaded_measures[2].reviewer_percentile_bin_width) == (0.5, 0.2)
+    assert (loaded_measures[3].score_weight_power, loaded_measures[3].tolerance) == (2, 1e-9)
+    for loaded_measure, measure in zip(loaded_measures, measures):
+        assert loaded_measure.threshold_percentile == measure.threshold_percentile
+        assert loaded_measure.reviewer_quality_estimates == measure.reviewer_quality_estimates
+        assert loaded_measure.content_quality_estimates == measure.content_quality_estimates
+        assert np.array_equal(loaded_measure.content_quality_estimates_commitment_order, measure.content_quality_estimates_commitment_order)
+        for loaded_value, value in zip(loaded_measure.evaluate_performance(loaded), measure.evaluate_performance(platform)):
+            assert np.array_equal(loaded_value, value)
+    # The restored measures calculate like the saved ones
+    loaded_measures[2].estimating_measure.calculate_estimates(loaded)
+    for loaded_measure, measure in zip(loaded_measures, measures):
+        loaded_measure.calculate_estimates(loaded)
+        assert loaded_measure.content_quality_estimates == measure.content_quality_estimates
+
+def test_storage_is_not_overwritten(tmp_path):
+    checkpoint_path, older_path, storage_path = str(tmp_path / "checkpoint"), str(tmp_path / "older"), str(tmp_path / "logs")
+    platform = simulation.run(SIMULATION_PARAMETERS=PARAMETERS, n_years=1, rng=np.random.default_rng(1), storage_path=storage_path)
+    snapshot.save_snapshot(older_path, platform)
+    # a second platform on the same logs: refused while the first one exists, and their logs are not started again unless asked
+    with pytest.raises(RuntimeError):
+        simulation.run(SIMULATION_PARAMETERS=PARAMETERS, n_years=1, storage_path=storage_path)
+    with pytest.raises(RuntimeError):
+        snapshot.load_platform(older_path)
+    simulation.run(SIMULATION_PARAMETERS=PARAMETERS, n_years=1, platform=platform, checkpoint_path=checkpoint_path)
+    n_scores = len(platform.scores)
+    del platform
+    with pytest.raises(FileExistsError):
+        simulation.run(SIMULATION_PARAMETERS=PARAMETERS, n_years=1, storage_path=storage_path)
+    # the older snapshot's rows are followed by the checkpoint's: going on from it would overwrite them
+    with pytest.raises(ValueError):
+        simulation.resume(older_path, 1)
+    assert len(simulation.resume(checkpoint_path, 1).scores) > n_scores
+    assert len(snapshot.load_platform(older_path, overwrite_storage=True).scores) < n_scores
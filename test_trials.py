@@ -0,0 +1,34 @@
+"""
+    Checks that trials.run_sweep gives the same results whatever the number of workers.
+"""
+import pickle
+import numpy as np
+import quality_measures
+import simulation
+import trials
+
+PARAMETERS = dict(simulation.SIMULATION_PARAMETERS, N_USERS_START=200)
+
+
+def make_measures():
+    simple_mean = quality_measures.SimpleMean()
+    return [simple_mean, quality_measures.BayesWeightingMeasureEstimate(simple_mean, 0.5, 0.2), quality_measures.ReputationPropagation()]
+
+def test_results_do_not_depend_on_workers():
+    # The serial run reuses the measure objects from trial to trial, the pool gets fresh copies of them:
+    # nothing a measure keeps from one platform (e.g. ReputationPropagation's warm start) may change the next one's results
+    sweep = [{}, {"N_USERS_START": 300}]
+    serial = trials.run_sweep(make_measures(), sweep, 3, SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.2, n_workers=1)
+    parallel = trials.run_sweep(make_measures(), sweep, 3, SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.2, n_workers=3)
+    for serial_point, parallel_point in zip(serial, parallel):
+        for serial_trials, parallel_trials in zip(serial_point, parallel_point):
+            for serial_performance, parallel_performance in zip(serial_trials, parallel_trials):
+                for serial_value, parallel_value in zip(serial_performance, parallel_performance):
+                    assert np.array_equal(serial_value, parallel_value)
+
+def test_calculated_measures_can_be_pickled():
+    platform = simulation.run(SIMULATION_PARAMETERS=PARAMETERS, p_bots=0.2, rng=np.random.default_rng(0))
+    for measure in make_measures():
+        measure.calculate_estimates(platform)
+        copy = pickle.loads(pickle.dumps(measure))
+        assert copy.content_quality_estimates == measure.content_quality_estimates
@@ -0,0 +1,167 @@
+"""
+    Topic vectors and similarity kernels. Topics are unit vectors (rows of float32 matrices), so the affinity of two
+    topics is their inner product (cosine similarity).
+    IVFIndex is an approximate nearest-neighbour index over such vectors (inverted file: the vectors are partitioned
+    into cells around k-means centroids, and a query only looks at the vectors of the few cells closest to it),
+    used for interest-driven content selection over millions of contents.
+"""
+import numpy as np
+import scipy.sparse
+from columnar_store import ColumnTable, csr_index
+
+# Number of float32 values gathered at once by the kernels below (bounds their temporary memory to ~16MB)
+CHUNK_VALUES = 1 << 22
+
+
+def unit_sphere(rng, n, dimensionality):
+    # n vectors uniformly distributed on the unit sphere, as an (n, dimensionality) float32 matrix
+    vectors = rng.standard_normal((n, dimensionality), dtype=np.float32)  # RANDOMCHOICE
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def paired_affinities(a, a_rows, b, b_rows):
+    """
+        a[a_rows[i]] . b[b_rows[i]] for every i: the affinities of a whole batch of (e.g. reviewer, content) pairs
+        with one einsum per chunk of pairs.
+    """
+    n, dimensionality = len(a_rows), a.shape[1]
+    affinities = np.empty(n, dtype=np.result_type(a, b))
+    chunk = max(CHUNK_VALUES // max(dimensionality, 1), 1)
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        affinities[start:stop] = np.einsum("ij,ij->i", a[a_rows[start:stop]], b[b_rows[start:stop]])
+    return affinities
+
+
+class IVFIndex:
+    """
+        Inverted-file index over a growing matrix of unit vectors (e.g. Platform.content["topic"]). It only stores the
+        cell of every vector; the vectors themselves are passed to the search methods, so they are never copied.
+        Vector i of the matrix is item i of the index (items are added in order, as the matrix grows).
+    """
+    def __init__(self, centroids):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self._cells = ColumnTable({"cell": (np.int32, ())})
+        self._lists = None
+        self.n_trained_on = None  # number of vectors the cells were trained on (see train)
+
+    @classmethod
+    def train(cls, vectors, n_cells, rng, n_iterations=10, n_training_vectors_per_cell=64):
+        """
+            Index whose cells come from spherical k-means on (a sample of) vectors. No vector is added yet.
+        """
+        n_cells = max(min(n_cells, len(vectors)), 1)
+        sample_size = min(len(vectors), n_cells * n_training_vectors_per_cell)
+        sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]  # RANDOMCHOICE
+        index = cls(sample[rng.choice(sample_size, n_cells, replace=False)])  # RANDOMCHOICE
+        for iteration in range(n_iterations):
+            cells = index.nearest_cells(sample, 1)[:, 0]
+            assignment = scipy.sparse.csr_matrix((np.ones(sample_size, dtype=np.float32), (cells, np.arange(sample_size))),
+                                                 shape=(n_cells, sample_size))
+            sums = np.asarray(assignment @ sample)
+            norms = np.linalg.norm(sums, axis=1)
+            filled = norms > 0  # cells that lost all their vectors keep their centroid
+            index.centroids[filled] = sums[filled] / norms[filled, None]
+        index.n_trained_on = len(vectors)
+        return index
+
+    def __len__(self):
+        return len(self._cells)
+
+    def add(self, vectors):
+        # Adds the next len(vectors) items
+        self._cells.extend(len(vectors), cell=self.nearest_cells(vectors, 1)[:, 0])
+
+    def lists(self):
+        # CSR index of the items by cell: the items of cell c are order[offsets[c]:offsets[c+1]]
+        if self._lists is None or self._lists[0] != len(self):
+            self._lists = (len(self),) + csr_index(self._cells["cell"], len(self.centroids))
+        return self._lists[1], self._lists[2]
+
+    def nearest_cells(self, queries, n_probe):
+        # (len(queries), n_probe) cells whose centroids are the most similar to each query (in no particular order)
+        n_probe = min(n_probe, len(self.centroids))
+        nearest = np.empty((len(queries), n_probe), dtype=np.int64)
+        chunk = max(CHUNK_VALUES // len(self.centroids), 1)
+        for start in range(0, len(queries), chunk):
+            similarities = queries[start:start + chunk] @ self.centroids.T
+            if n_probe <= 8 and n_probe < len(self.centroids):
+                # a few argmax passes are faster than a partition for the few nearest cells
+                rows = np.arange(len(similarities))
+                for probe in range(n_probe):
+                    nearest[start:start + chunk, probe] = best = np.argmax(similarities, axis=1)
+                    similarities[rows, best] = -np.inf
+            elif n_probe < len(self.centroids):
+                nearest[start:start + chunk] = np.argpartition(-similarities, n_probe - 1, axis=1)[:, :n_probe]
+            else:
+                nearest[start:start + chunk] = np.arange(n_probe)
+        return nearest
+
+    def search(self, vectors, queries, k, n_probe=8):
+        """
+            Approximate k nearest neighbours (highest inner product) of every query among the items of its n_probe
+            nearest cells. Returns (ids, similarities), both (len(queries), k), best first; -1 / -inf pad the rows
+            of queries with fewer than k items in their cells.
+        """
+        offsets, order = self.lists()
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        similarities = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        cells = self.nearest_cells(queries, n_probe)
+        cell_sizes = offsets[cells + 1] - offsets[cells]
+        query_start = 0
+        while query_start < len(queries):
+            # as many queries as fit in one chunk of candidate vectors (at least one)
+            n_candidates = np.cumsum(cell_sizes[query_start:].sum(axis=1))
+            query_stop = query_start + max(int(np.searchsorted(n_candidates, CHUNK_VALUES // vectors.shape[1], side="right")), 1)
+            chunk_cells, chunk_sizes = cells[query_start:query_stop], cell_sizes[query_start:query_stop]
+            # every (query, candidate) pair of the chunk, grouped by query
+            pair_queries = np.repeat(np.arange(query_start, query_stop), chunk_sizes.sum(axis=1))
+            pair_cells, pair_sizes = chunk_cells.ravel(), chunk_sizes.ravel()
+            first_positions = offsets[pair_cells] - (np.cumsum(pair_sizes) - pair_sizes)
+            candidates = order[np.repeat(first_positions, pair_sizes) + np.arange(pair_sizes.sum())]
+            pair_similarities = paired_affinities(queries, pair_queries, vectors, candidates)
+            # best k of every query: sort by query, then by decreasing similarity
+            ranking = np.lexsort((-pair_similarities, pair_queries))
+            query_offsets = np.searchsorted(pair_queries[ranking], np.arange(query_start, query_stop + 1))
+            rank = np.arange(len(ranking)) - np.repeat(query_offsets[:-1], np.diff(query_offsets))
+            top = rank < k
+            ids[pair_queries[ranking][top], rank[top]] = candidates[ranking][top]
+            similarities[pair_queries[ranking][top], rank[top]] = pair_similarities[ranking][top]
+            query_start = query_stop
+        return ids, similarities
+
+    def sample_nearby(self, vectors, queries, rng, n_probe=4, n_candidates=32, n_samples=1):
+        """
+            For every query, n_samples times: the most similar of n_candidates items drawn uniformly (with replacement)
+            from the items of its n_probe nearest cells. That is an item close to the query, found in
+            O(n_cells + n_candidates) per query (the nearest cells are shared by the query's samples).
+            Queries whose cells are all empty get uniformly chosen items. Returns a (len(queries), n_samples) array.
+        """
+        if len(self) == 0: return rng.integers(len(vectors), size=(len(queries), n_samples))  # RANDOMCHOICE
+        offsets, order = self.lists()
+        chosen = np.empty((len(queries), n_samples), dtype=np.int64)
+        chunk = max(CHUNK_VALUES // (n_samples * n_candidates * vectors.shape[1]), 1)
+        for start in range(0, len(queries), chunk):
+            chunk_queries = queries[start:start + chunk]
+            n_queries = len(chunk_queries)
+            cells = self.nearest_cells(chunk_queries, n_probe)
+            cumulative_sizes = np.cumsum(offsets[cells + 1] - offsets[cells], axis=1)
+            totals = cumulative_sizes[:, -1]
+            # uniform position among the items of the query's cells -> cell holding it -> item
+            positions = (rng.random((n_queries, n_samples * n_candidates)) * totals[:, None]).astype(np.int64)  # RANDOMCHOICE
+            cell_i = np.zeros(positions.shape, dtype=np.int64)
+            for cell_end in cumulative_sizes[:, :-1].T:
+                cell_i += positions >= cell_end[:, None]
+            before = np.where(cell_i > 0, np.take_along_axis(cumulative_sizes, np.maximum(cell_i - 1, 0), axis=1), 0)
+            candidate_cells = np.take_along_axis(cells, cell_i, axis=1)
+            candidates = order[np.minimum(offsets[candidate_cells] + positions - before, len(order) - 1)]
+            affinities = np.matmul(vectors[candidates], chunk_queries[:, :, None])[:, :, 0]
+            # best candidate of every sample
+            affinities = affinities.reshape(n_queries * n_samples, n_candidates)
+            best = np.argmax(affinities, axis=1)
+            chunk_chosen = candidates.reshape(n_queries * n_samples, n_candidates)[np.arange(n_queries * n_samples), best]
+            chunk_chosen = chunk_chosen.reshape(n_queries, n_samples)
+            empty = totals == 0
+            chunk_chosen[empty] = rng.integers(len(vectors), size=(np.count_nonzero(empty), n_samples))  # RANDOMCHOICE
+            chosen[start:start + chunk] = chunk_chosen
+        return chosen
@@ -0,0 +1,62 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import simulation
+from measure_engine import MeasureEngine
+
+
+def run_trial(measures, seed, SIMULATION_PARAMETERS=simulation.SIMULATION_PARAMETERS, p_bots=0, n_years=1, commitment_resolution=0.1):
+    """
+        Simulates one platform with its own np.random.Generator (seeded with seed, e.g. a SeedSequence)
+        and returns [measure.evaluate_performance(...) for measure in measures].
+        The measures share their common intermediates (see measure_engine); they run one after the other,
+        as trials are already spread over processes.
+    """
+    platform = simulation.run(SIMULATION_PARAMETERS=SIMULATION_PARAMETERS, p_bots=p_bots, n_years=n_years,
+                              rng=np.random.default_rng(seed))
+    return MeasureEngine(measures, n_workers=1).evaluate(platform, commitment_resolution=commitment_resolution)
+
+def _run_trial(arguments):
+    return run_trial(**arguments)
+
+
+def run_sweep(measures, sweep, n_trials, SIMULATION_PARAMETERS=simulation.SIMULATION_PARAMETERS, p_bots=0, n_years=1,
+              commitment_resolution=0.1, seed=0, n_workers=1):
+    """
+        Runs n_trials simulations for every point of the sweep, spread over a pool of n_workers processes.
+            sweep is a list of dicts overriding SIMULATION_PARAMETERS entries (e.g. "N_USERS_START"), "p_bots" or "n_years"
+            (sweep over measure parameters such as thresholds by passing one measure per value in measures;
+            all measures are evaluated on the same platforms).
+        Trial t of sweep point i always gets the generator of SeedSequence(seed).spawn(len(sweep))[i].spawn(n_trials)[t],
+        so results are bit-identical whatever the number of workers.
+        Returns performances[point_i][measure_i][trial_i] = measure.evaluate_performance(...) tuple
+    """
+    point_seeds = np.random.SeedSequence(seed).spawn(len(sweep))
+    tasks = []
+    for point, point_seed in zip(sweep, point_seeds):
+        point = dict(point)
+        point_p_bots = point.pop("p_bots", p_bots)
+        point_n_years = point.pop("n_years", n_years)
+        parameters = dict(SIMULATION_PARAMETERS, **point)
+        for trial_seed in point_seed.spawn(n_trials):
+            tasks.append(dict(measures=measures, seed=trial_seed, SIMULATION_PARAMETERS=parameters, p_bots=point_p_bots,
+                              n_years=point_n_years, commitment_resolution=commitment_resolution))
+
+    if n_workers == 1:
+        results = [_run_trial(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(_run_trial, tasks))
+
+    performances = []
+    for point_i in range(len(sweep)):
+        point_results = results[point_i * n_trials:(point_i + 1) * n_trials]
+        performances.append([[trial_results[measure_i] for trial_results in point_results] for measure_i in range(len(measures))])
+    return performances
+
+def run_trials(measures, n_trials, SIMULATION_PARAMETERS=simulation.SIMULATION_PARAMETERS, p_bots=0, n_years=1,
+               commitment_resolution=0.1, seed=0, n_workers=1):
+    """
+        Parallel version of the Tests.ipynb trial loop: returns measure_performances[measure_i][trial_i]
+    """
+    return run_sweep(measures, [{}], n_trials, SIMULATION_PARAMETERS=SIMULATION_PARAMETERS, p_bots=p_bots, n_years=n_years,
+                     commitment_resolution=commitment_resolution, seed=seed, n_workers=n_workers)[0]